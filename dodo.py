@@ -355,6 +355,97 @@ def task_build():
         ],
     }
 
+def runtime_svcs():
+    return [svc for svc in SVCS if os.path.isfile(f'{CFG.APP_PROJPATH}/{svc}/Dockerfile.runtime')]
+
+def source_date_epoch():
+    try:
+        return check_output('git log -1 --format=%ct', shell=True).decode('utf-8').strip()
+    except CalledProcessError:
+        return '0'
+
+def task_runtime():
+    '''
+    build slim runtime image(s) with precompiled, reproducible bytecode
+    '''
+    for svc in runtime_svcs():
+        imagename = f'itcw/{CFG.APP_PROJNAME}_{svc}:{CFG.APP_VERSION}-runtime'
+        cmd = ' '.join([
+            f'cd {CFG.APP_PROJPATH}/{svc} &&',
+            'docker build',
+            '-f Dockerfile.runtime',
+            '--target runtime',
+            f'--build-arg SOURCE_DATE_EPOCH={source_date_epoch()}',
+            f'-t {imagename}',
+            '.',
+        ])
+        yield {
+            'name': svc,
+            'task_dep': [
+                'noroot',
+                f'tar:{svc}',
+            ],
+            'actions': [
+                f'echo "{cmd}"',
+                f'{cmd}',
+            ],
+        }
+
+def time_to_ready(imagename, port=8080, path='/version', timeout=60):
+    '''
+    seconds from docker run until path first answers 200, or None
+    '''
+    import time
+    from urllib.request import urlopen
+    envfiles = ' '.join(
+        f'--env-file {CFG.APP_PROJPATH}/{envfile}'
+        for envfile in ('secrets.env', 'generated.env')
+        if os.path.isfile(f'{CFG.APP_PROJPATH}/{envfile}'))
+    start = time.monotonic()
+    container = check_output(f'docker run -d {envfiles} -p {port} {imagename}', shell=True).decode('utf-8').strip()
+    try:
+        mapping = check_output(f'docker port {container} {port}', shell=True).decode('utf-8').split()[0]
+        url = f'http://127.0.0.1:{mapping.rsplit(":", 1)[1]}{path}'
+        while time.monotonic() - start < timeout:
+            try:
+                with urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.monotonic() - start
+            except OSError:
+                pass
+            time.sleep(0.05)
+        return None
+    finally:
+        check_call(f'docker rm -f {container}', shell=True, stdout=PIPE)
+
+def task_ready():
+    '''
+    measure container time-to-ready of the built and the runtime image(s)
+    '''
+    def measure(svc):
+        for imagename in (
+            f'itcw/{CFG.APP_PROJNAME}_{svc}:{CFG.APP_VERSION}',
+            f'itcw/{CFG.APP_PROJNAME}_{svc}:{CFG.APP_VERSION}-runtime'):
+            elapsed = time_to_ready(imagename)
+            if elapsed is None:
+                print(f'{imagename} was not ready within 60s')
+                return False
+            print(f'{imagename} ready in {elapsed:.2f}s')
+        return True
+    for svc in runtime_svcs():
+        yield {
+            'name': svc,
+            'task_dep': [
+                'noroot',
+                'build',
+                f'runtime:{svc}',
+            ],
+            'actions': [
+                (measure, [svc]),
+            ],
+            'verbosity': 2,
+        }
+
 def task_publish():
     '''
     publish docker image(s) to docker hub
@@ -9,10 +9,11 @@ import re
 import pwd
 import sys
 import time
+import signal
+import asyncio
 import logging
-import sh
 
-from decouple import UndefinedValueError, AutoConfig, config
+from decouple import UndefinedValueError, AutoConfig, config, undefined
 
 LOG_LEVELS = [
     'DEBUG',
@@ -68,11 +69,17 @@ def git(*args, strip=True, **kwargs):
     '''
     git
     '''
+    try:
+        import sh
+    except ImportError:
+        raise NotGitRepoError # runtime images ship without sh and git
     try:
         result = str(sh.contrib.git(*args, **kwargs)) #pylint: disable=no-member
         if strip:
             result = result.strip()
         return result
+    except sh.CommandNotFound:
+        raise NotGitRepoError
     except sh.ErrorReturnCode as e:
         stderr = e.stderr.decode('utf-8')
         if 'not a git repository' in stderr.lower():
@@ -304,9 +311,11 @@ class AutoConfigPlus(AutoConfig): #pylint: disable=too-many-public-methods
         '''
         getattr
         '''
-        log.info(f'attr = {attr}')
+        log.debug(f'attr = {attr}')
         if attr == 'create_doit_tasks': #note: to keep pydoit's hands off
             return lambda: None
+        if attr in SCHEMA_BY_NAME:
+            return SCHEMA_BY_NAME[attr].resolve(self)
         result = self(attr)
         try:
             return int(result)
@@ -314,3 +323,213 @@ class AutoConfigPlus(AutoConfig): #pylint: disable=too-many-public-methods
             return result
 
 CFG = AutoConfigPlus()
+
+class Setting:
+    '''
+    declared setting: name, cast and default (undefined means required)
+    '''
+    __slots__ = ('name', 'cast', 'default')
+
+    def __init__(self, name, cast=str, default=undefined):
+        '''
+        init
+        '''
+        self.name = name
+        self.cast = cast
+        self.default = default
+
+    def resolve(self, config):
+        '''
+        resolve
+        '''
+        return config(self.name, default=self.default, cast=self.cast)
+
+SCHEMA = (
+    Setting('SLACK_VERIFICATION_TOKEN'),
+    Setting('SLACK_TEAM_ID'),
+    Setting('BOT_USER_OAUTH_ACCESS_TOKEN'),
+    Setting('PROPS_BOT_CHANNEL_ID'),
+    Setting('PROPS_BOT_ALIASES', str, ''),
+    Setting('PROPS_BOT_SOCKET_MODE', bool, False),
+    Setting('SLACK_APP_TOKEN', str, ''),
+    Setting('SLACK_TEAMS', str, ''),
+    Setting('SLACK_RATE_LIMIT', float, 1.0),
+    Setting('SLACK_RATE_BURST', int, 20),
+    Setting('SLACK_RETRIES', int, 2),
+    Setting('SLACK_CALL_BUDGET_MS', int, 2500),
+    Setting('SLACK_BREAKER_THRESHOLD', int, 5),
+    Setting('SLACK_BREAKER_RESET', float, 30.0),
+    Setting('PROPS_BOT_STATE_PATH', str, '/var/lib/props-bot'),
+    Setting('PROPS_BOT_SNAPSHOT_INTERVAL', int, 300),
+    Setting('PROPS_BOT_FLUSH_INTERVAL', float, 1.0),
+    Setting('PROPS_BOT_HOT_ENTRIES', int, 0), # per team: global table cells, and as many split between channels
+    Setting('APP_WORKERS', int, 2),
+    Setting('PROPS_BOT_DEFERRED_WORKERS', int, 4),
+    Setting('PROPS_BOT_DIGEST_CRON', str, '0 16 * * 5'),
+    Setting('PROPS_BOT_DIGEST_TOP', int, 10),
+    Setting('PROPS_BOT_ADMIN_TOKEN', str, ''),
+    Setting('PROPS_BOT_PROFILE_SAMPLE_RATE', float, 0.0),
+    Setting('PROPS_BOT_SLOW_REQUEST_MS', int, 0),
+    Setting('PROPS_BOT_JSON_ENCODER', str, 'auto'),
+    Setting('LOG_LEVEL', int, logging.WARNING),
+)
+
+SCHEMA_BY_NAME = {setting.name: setting for setting in SCHEMA}
+
+class MissingSettingsError(Exception):
+    '''
+    MissingSettingsError
+    '''
+    def __init__(self, names):
+        '''
+        init
+        '''
+        msg = f'missing required settings: {", ".join(names)}'
+        super(MissingSettingsError, self).__init__(msg)
+
+class InvalidSettingError(Exception):
+    '''
+    InvalidSettingError
+    '''
+    def __init__(self, name, error):
+        '''
+        init
+        '''
+        msg = f'invalid setting {name}: {error}'
+        super(InvalidSettingError, self).__init__(msg)
+
+class ImmutableSnapshotError(Exception):
+    '''
+    ImmutableSnapshotError
+    '''
+    def __init__(self, attr):
+        '''
+        init
+        '''
+        msg = f'config snapshot is immutable; attr = {attr}'
+        super(ImmutableSnapshotError, self).__init__(msg)
+
+class Snapshot:
+    '''
+    immutable, typed snapshot of SCHEMA validated once at load time; every
+    setting is a slot so reading one is a plain attribute load
+    '''
+    __slots__ = tuple(setting.name for setting in SCHEMA) + ('LOADED',)
+
+    def __init__(self, config, schema=SCHEMA):
+        '''
+        init
+        '''
+        missing = []
+        for setting in schema:
+            try:
+                value = setting.resolve(config)
+            except UndefinedValueError:
+                missing.append(setting.name)
+                continue
+            except ValueError as error:
+                raise InvalidSettingError(setting.name, error)
+            object.__setattr__(self, setting.name, value)
+        if missing:
+            raise MissingSettingsError(missing)
+        # the one worker does TieredTable's sqlite I/O (faults, flushes, len)
+        # on its loop thread, so a slow disk stalls every request it serves
+        if getattr(self, 'PROPS_BOT_HOT_ENTRIES', 0) and getattr(self, 'APP_WORKERS', 1) > 1:
+            raise InvalidSettingError(
+                'PROPS_BOT_HOT_ENTRIES',
+                'tiered props need APP_WORKERS=1, each worker would spill over the others\' counts; '
+                f'APP_WORKERS = {self.APP_WORKERS}')
+        object.__setattr__(self, 'LOADED', time.time())
+
+    def __setattr__(self, attr, value):
+        '''
+        setattr
+        '''
+        raise ImmutableSnapshotError(attr)
+
+class ReloadableConfig:
+    '''
+    holds the current Snapshot and swaps it atomically on SIGHUP or when the
+    settings file changes; readers grab the snapshot by reference, so a reload
+    never costs anything on the request path
+    '''
+    def __init__(self, search_path=None, factory=AutoConfigPlus):
+        '''
+        init
+        '''
+        self.search_path = os.path.abspath(search_path or os.getcwd())
+        self.factory = factory
+        self.listeners = []
+        self.snapshot = self.load()
+        self.mtime = self.stat()
+
+    def subscribe(self, listener):
+        '''
+        call listener(snapshot) now and after every successful reload
+        '''
+        self.listeners.append(listener)
+        listener(self.snapshot)
+
+    @property
+    def path(self):
+        '''
+        path of the settings file (.env or settings.ini) decouple would use
+        '''
+        try:
+            return self.factory()._find_file(self.search_path) #pylint: disable=protected-access
+        except Exception: #pylint: disable=broad-except
+            return None
+
+    def stat(self):
+        '''
+        stat
+        '''
+        path = self.path
+        try:
+            return os.stat(path).st_mtime if path else None
+        except OSError:
+            return None
+
+    def load(self):
+        '''
+        build a new snapshot from a fresh AutoConfig, which rereads the file
+        '''
+        return Snapshot(self.factory(search_path=self.search_path))
+
+    def reload(self):
+        '''
+        build a new snapshot then swap it in with a single assignment; a bad
+        settings file keeps the previous snapshot instead of taking us down
+        '''
+        try:
+            snapshot = self.load()
+        except (MissingSettingsError, InvalidSettingError) as error:
+            log.error(f'config reload rejected: {error}')
+            return self.snapshot
+        self.snapshot = snapshot
+        logging.getLogger().setLevel(snapshot.LOG_LEVEL)
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as ex: #pylint: disable=broad-except
+                log.error(f'config listener {listener} failed: {ex}')
+        log.warning(f'config reloaded from {self.path}')
+        return snapshot
+
+    def install(self, loop=None):
+        '''
+        reload on SIGHUP
+        '''
+        loop = loop or asyncio.get_event_loop()
+        loop.add_signal_handler(signal.SIGHUP, self.reload)
+
+    async def watch(self, interval=1.0):
+        '''
+        poll the settings file mtime and reload when it changes
+        '''
+        while True:
+            await asyncio.sleep(interval)
+            mtime = self.stat()
+            if mtime != self.mtime:
+                self.mtime = mtime
+                self.reload()
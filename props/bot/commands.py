@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+/props-bot slash command queries
+'''
+
+import time
+import heapq
+
+from types import GeneratorType
+from itertools import chain, islice
+
+DEFAULT_COUNT = 10
+MAX_COUNT = 50
+CHUNK_ROWS = 1000
+
+USAGE = '\n'.join([
+    'usage:',
+    '/props-bot leaderboard [global] [prop] [count]',
+    '/props-bot stats <user>',
+    '/props-bot history <user>',
+])
+
+class CommandError(Exception):
+    '''
+    CommandError; the message is shown to the user
+    '''
+
+def ephemeral(text):
+    '''
+    ephemeral
+    '''
+    return dict(response_type='ephemeral', text=text)
+
+def member_name(team, token):
+    '''
+    the directory name for a mention or name, token itself if unknown
+    '''
+    member = team.directory.resolve(token) if team.directory.loaded else None
+    return member['name'] if member else token
+
+def chunked_top(props, count, prop=None, chunk_rows=CHUNK_ROWS):
+    '''
+    props.top, chunk_rows candidate cells at a time; yields between chunks
+    '''
+    cells, top = iter(props.candidates(count, prop)), []
+    while True:
+        chunk = list(islice(cells, chunk_rows))
+        top = heapq.nlargest(count, chain(top, chunk), key=lambda cell: cell[2])
+        if len(chunk) < chunk_rows:
+            return top
+        yield
+
+def leaderboard(team, channel, args):
+    '''
+    top props in this channel when it is a props channel, else globally;
+    a generator, so a deferred run can let the loop in between chunks
+    '''
+    scope = channel if team.allows(channel) else None
+    if args and args[0] == 'global':
+        scope, args = None, args[1:]
+    count = DEFAULT_COUNT
+    if args and args[-1].isdigit():
+        count, args = min(int(args[-1]), MAX_COUNT), args[:-1]
+    prop = args[0] if args else None
+    top = yield from chunked_top(team.scope_props(scope), count, prop)
+    if not top:
+        return ephemeral('no props yet')
+    where = 'here' if scope else 'everywhere'
+    lines = [f'{i}. {name}:{prop} => {value}' for i, (name, prop, value) in enumerate(top, 1)]
+    return ephemeral('\n'.join([f'top props {where}:'] + lines))
+
+def stats(team, channel, args):
+    '''
+    one user's props and total
+    '''
+    if not args:
+        raise CommandError('stats needs a user')
+    name = member_name(team, args[0])
+    props = team.props.user_props(name)
+    if not props:
+        return ephemeral(f'{name} has no props yet')
+    lines = [f'{name}:{prop} => {value}' for prop, value in sorted(props.items(), key=lambda item: -item[1])]
+    return ephemeral('\n'.join(lines + [f'total => {sum(props.values())}']))
+
+def history(team, channel, args):
+    '''
+    one user's props, most recently changed first
+    '''
+    if not args:
+        raise CommandError('history needs a user')
+    name = member_name(team, args[0])
+    rows = sorted(team.props.rows(name=name), key=lambda row: -row[3])
+    if not rows:
+        return ephemeral(f'{name} has no props yet')
+    lines = [
+        f'{time.strftime("%Y-%m-%d %H:%M", time.gmtime(updated))} {name}:{prop} => {value}'
+        for name, prop, value, updated in rows[:MAX_COUNT]]
+    return ephemeral('\n'.join(lines))
+
+COMMANDS = {
+    'leaderboard': leaderboard,
+    'top': leaderboard,
+    'stats': stats,
+    'history': history,
+}
+
+def parse(text):
+    '''
+    (command function, args), or (None, args) for anything unknown
+    '''
+    words = (text or '').split()
+    if not words:
+        return None, []
+    return COMMANDS.get(words[0].lower()), words[1:]
+
+def steps(func, team, channel, args):
+    '''
+    run a command a chunk at a time: yields between chunks and returns the
+    response, turning CommandErrors into usage help
+    '''
+    try:
+        result = func(team, channel, args)
+        if isinstance(result, GeneratorType):
+            result = yield from result
+        return result
+    except CommandError as ex:
+        return ephemeral(f'{ex}\n{USAGE}')
+
+def finish(generator):
+    '''
+    run a generator to its return value
+    '''
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
+def run(func, team, channel, args):
+    '''
+    run a command in one go
+    '''
+    return finish(steps(func, team, channel, args))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+deferred slash command responses: ack now, run the query in the background
+and post the result to the command's response_url
+'''
+
+import asyncio
+import logging
+
+from types import GeneratorType
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import jsonenc
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = 10.0
+
+class Deferred:
+    '''
+    at most workers deferred responses in flight; the rest wait their turn.
+    queries run on the loop thread, which owns the props tables, a step at a
+    time when they are generators, and the posts go through a pooled session
+    on a dedicated executor, so slow response_urls never tie up the default
+    executor event handling uses
+    '''
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, session=None):
+        '''
+        init
+        '''
+        self.workers = workers
+        self.timeout = timeout
+        self._session = session
+        self._semaphore = None
+        self._executor = None
+        self.tasks = set()
+
+    @property
+    def session(self):
+        '''
+        one keep-alive session, its pool sized to the workers
+        '''
+        if self._session is None:
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    @property
+    def semaphore(self):
+        '''
+        created on first use so it binds to the running loop
+        '''
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._semaphore
+
+    @property
+    def executor(self):
+        '''
+        executor
+        '''
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def post(self, response_url, message):
+        '''
+        post message to response_url; blocking
+        '''
+        response = self.session.post(
+            response_url,
+            data=jsonenc.dumps(message),
+            headers={'Content-Type': 'application/json'},
+            timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    async def complete(steps):
+        '''
+        run a generator to its return value, letting the loop in after every
+        step so long queries don't stall event handling
+        '''
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+            await asyncio.sleep(0)
+
+    async def run(self, response_url, query):
+        '''
+        run query() and post what it returns, or what it returns from a
+        generator; failures are posted too, so the user is never left
+        looking at "working..."
+        '''
+        async with self.semaphore:
+            await asyncio.sleep(0) # let the ack go out first
+            try:
+                message = query()
+                if isinstance(message, GeneratorType):
+                    message = await self.complete(message)
+            except Exception as ex: #pylint: disable=broad-except
+                log.error(f'deferred query raised {ex}')
+                message = dict(response_type='ephemeral', text=f'sorry, that failed: {ex}')
+            loop = asyncio.get_event_loop()
+            try:
+                await loop.run_in_executor(self.executor, partial(self.post, response_url, message))
+            except Exception as ex: #pylint: disable=broad-except
+                log.error(f'deferred response to {response_url} failed: {ex}')
+
+    def submit(self, response_url, query):
+        '''
+        schedule query; returns the task
+        '''
+        task = asyncio.ensure_future(self.run(response_url, query))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+scheduled top props digests
+'''
+
+import os
+import heapq
+import logging
+
+from datetime import datetime, timedelta
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CRON = '0 16 * * 5'
+DEFAULT_TOP = 10
+DEFAULT_GRACE = 60
+MINUTE_FORMAT = '%Y-%m-%dT%H:%M'
+NO_PROP = '' # as in tiered, the parser never yields an empty prop
+
+SCHEMA = '''
+create table if not exists totals (
+    at text not null,
+    name text not null,
+    prop text not null,
+    total integer not null,
+    primary key (at, name, prop)
+) without rowid;
+create table if not exists rolled (
+    id integer primary key check (id = 0),
+    at text not null
+);
+'''
+
+CRON_RANGES = (
+    (0, 59), # minute
+    (0, 23), # hour
+    (1, 31), # day of month
+    (1, 12), # month
+    (0, 6),  # day of week, 0 = sunday
+)
+
+class CronSpecError(Exception):
+    '''
+    CronSpecError
+    '''
+    def __init__(self, spec):
+        '''
+        init
+        '''
+        msg = f'cron spec must be five fields of *, */n, n, a-b or lists of those; spec = {spec}'
+        super(CronSpecError, self).__init__(msg)
+
+class Cron:
+    '''
+    the subset of cron syntax we need: *, */n, n, a-b and comma lists
+    '''
+    def __init__(self, spec=DEFAULT_CRON):
+        '''
+        init
+        '''
+        self.spec = spec
+        fields = spec.split()
+        if len(fields) != 5:
+            raise CronSpecError(spec)
+        try:
+            self.fields = [self.expand(field, lo, hi) for field, (lo, hi) in zip(fields, CRON_RANGES)]
+        except ValueError:
+            raise CronSpecError(spec)
+
+    @staticmethod
+    def expand(field, lo, hi):
+        '''
+        expand one field into the set of values it matches
+        '''
+        values = set()
+        for part in field.split(','):
+            part, _, step = part.partition('/')
+            if part == '*':
+                start, stop = lo, hi
+            elif '-' in part:
+                start, stop = map(int, part.split('-'))
+            else:
+                start = stop = int(part)
+            values.update(range(start, stop + 1, int(step) if step else 1))
+        return frozenset(values)
+
+    def matches(self, when):
+        '''
+        matches
+        '''
+        minute, hour, day, month, weekday = self.fields
+        return (
+            when.minute in minute and
+            when.hour in hour and
+            when.day in day and
+            when.month in month and
+            (when.weekday() + 1) % 7 in weekday)
+
+    def latest(self, now, grace=DEFAULT_GRACE):
+        '''
+        the most recent scheduled minute within the last grace minutes
+        '''
+        when = now.replace(second=0, microsecond=0)
+        for _ in range(grace + 1):
+            if self.matches(when):
+                return when
+            when -= timedelta(minutes=1)
+        return None
+
+class Digest:
+    '''
+    running (name, prop) totals for the current period, updated on every
+    change so building the digest never scans the props table; rolled is
+    the scheduled run the period started at. kept in memory, so it is one
+    process's view and the snapshot carries it over restarts
+    '''
+    shared = False
+
+    def __init__(self):
+        '''
+        init
+        '''
+        self.totals = {}
+        self.rolled = None
+
+    def record(self, name, prop, delta):
+        '''
+        record
+        '''
+        key = (name, prop)
+        self.totals[key] = self.totals.get(key, 0) + delta
+
+    def top(self, count=DEFAULT_TOP, until=None): #pylint: disable=unused-argument
+        '''
+        top; everything recorded so far, whatever until is
+        '''
+        return heapq.nlargest(count, self.totals.items(), key=lambda item: item[1])
+
+    def reset(self):
+        '''
+        reset
+        '''
+        self.totals = {}
+
+    def roll(self, when):
+        '''
+        start a new period at the run at when, once per run; False if the
+        period already started there
+        '''
+        if self.rolled is not None and when <= self.rolled:
+            return False
+        self.reset()
+        self.rolled = when
+        return True
+
+    def message(self, count=DEFAULT_TOP, until=None):
+        '''
+        message
+        '''
+        top = [(key, value) for key, value in self.top(count, until) if value > 0]
+        if not top:
+            return None
+        lines = [f'{i}. {name}:{prop} +{value}' for i, ((name, prop), value) in enumerate(top, 1)]
+        return '\n'.join(['top props this period:'] + lines)
+
+class SharedDigest(Digest):
+    '''
+    Digest kept in sqlite at path so every worker process records into the
+    same totals and whichever one claims a run posts all of them. totals
+    are bucketed by the minute they were recorded in, so a run only counts
+    what came before it and a worker that rolls late never drops another's
+    newer records
+    '''
+    shared = True
+
+    def __init__(self, path): #pylint: disable=super-init-not-called
+        '''
+        init; the sqlite file at path is opened on first use, in the
+        worker process that uses it
+        '''
+        self.path = path
+        self._connection = None
+
+    @property
+    def connection(self):
+        '''
+        connection
+        '''
+        if self._connection is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._connection = sqlite3.connect(self.path, isolation_level=None)
+            self._connection.execute('pragma journal_mode=wal')
+            self._connection.execute('pragma synchronous=normal')
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    @property
+    def rolled(self):
+        '''
+        the run the shared period started at, or None
+        '''
+        row = self.connection.execute('select at from rolled').fetchone()
+        return None if row is None else datetime.strptime(row[0], MINUTE_FORMAT)
+
+    @property
+    def totals(self):
+        '''
+        {(name, prop): total} for the current period
+        '''
+        return dict(self.top(None))
+
+    def record(self, name, prop, delta):
+        '''
+        record
+        '''
+        key = (f'{datetime.utcnow():{MINUTE_FORMAT}}', name, NO_PROP if prop is None else prop)
+        with self.connection:
+            self.connection.execute('begin immediate')
+            self.connection.execute('insert or ignore into totals values (?, ?, ?, 0)', key)
+            self.connection.execute(
+                'update totals set total = total + ? where at = ? and name = ? and prop = ?', (delta, ) + key)
+
+    def top(self, count=DEFAULT_TOP, until=None):
+        '''
+        the count largest totals recorded since the period started and
+        before until; every total when count is None
+        '''
+        sql = 'select name, prop, sum(total) as total from totals'
+        params = []
+        if until is not None:
+            sql += ' where at < ?'
+            params.append(f'{until:{MINUTE_FORMAT}}')
+        sql += ' group by name, prop order by total desc'
+        if count is not None:
+            sql += ' limit ?'
+            params.append(count)
+        rows = self.connection.execute(sql, params)
+        return [((name, None if prop == NO_PROP else prop), total) for name, prop, total in rows]
+
+    def reset(self):
+        '''
+        reset
+        '''
+        with self.connection:
+            self.connection.execute('begin immediate')
+            self.connection.execute('delete from totals')
+
+    def roll(self, when):
+        '''
+        start a new period at the run at when, once per run across every
+        worker; drops only the totals recorded before when
+        '''
+        at = f'{when:{MINUTE_FORMAT}}'
+        with self.connection:
+            self.connection.execute('begin immediate')
+            row = self.connection.execute('select at from rolled').fetchone()
+            if row is not None and at <= row[0]:
+                return False
+            self.connection.execute('insert or replace into rolled values (0, ?)', (at, ))
+            self.connection.execute('delete from totals where at < ?', (at, ))
+        return True
+
+class RunMarker:
+    '''
+    last-run markers under path; claiming a run creates its marker with
+    O_EXCL, so only one process ever wins a given run, including across
+    restarts, and across replicas when path is on a shared volume
+    '''
+    def __init__(self, path):
+        '''
+        init
+        '''
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def filename(self, name, when):
+        '''
+        filename
+        '''
+        return os.path.join(self.path, f'{name}.{when:%Y%m%dT%H%M}.done')
+
+    def claim(self, name, when):
+        '''
+        True for exactly one caller per (name, when)
+        '''
+        try:
+            fd = os.open(self.filename(name, when), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
+
+    def release(self, name, when):
+        '''
+        give a claim back after a failed run so it can be retried
+        '''
+        try:
+            os.remove(self.filename(name, when))
+        except FileNotFoundError:
+            pass
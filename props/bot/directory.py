@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+directory
+'''
+
+import re
+import time
+import asyncio
+import logging
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from pagination import pages, apages, apaginate
+from resilience import CircuitOpenError, SlackUnavailableError, RateLimitExceededError
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+DEFAULT_LIMIT = 100
+DEFAULT_FUZZY_CUTOFF = 0.8
+MAX_FUZZY_CANDIDATES = 64
+
+mention_regex = re.compile(r'^<@(?P<id>[A-Z0-9]+)(\|[^>]*)?>$')
+
+class PrefixIndex:
+    '''
+    sorted (lowercased key, value) pairs; a prefix search is a bisect plus
+    a walk over at most limit matches, regardless of how many keys there are
+    '''
+    def __init__(self, items=()):
+        '''
+        init
+        '''
+        self.keys = sorted((key.lower(), value) for key, value in items if key)
+
+    def __len__(self):
+        '''
+        len
+        '''
+        return len(self.keys)
+
+    def __contains__(self, key):
+        '''
+        contains
+        '''
+        item = (key.lower(), )
+        i = bisect_left(self.keys, item)
+        return i < len(self.keys) and self.keys[i][0] == item[0]
+
+    def add(self, key, value=None):
+        '''
+        add
+        '''
+        if not key:
+            return
+        item = (key.lower(), key if value is None else value)
+        i = bisect_left(self.keys, item)
+        if i == len(self.keys) or self.keys[i] != item:
+            insort(self.keys, item)
+
+    def remove(self, key, value=None):
+        '''
+        remove
+        '''
+        item = (key.lower(), key if value is None else value)
+        i = bisect_left(self.keys, item)
+        if i < len(self.keys) and self.keys[i] == item:
+            del self.keys[i]
+
+    def search(self, prefix, limit=DEFAULT_LIMIT):
+        '''
+        values whose key starts with prefix, in key order
+        '''
+        prefix = (prefix or '').lower()
+        results = []
+        i = bisect_left(self.keys, (prefix, ))
+        while i < len(self.keys) and len(results) < limit:
+            key, value = self.keys[i]
+            if not key.startswith(prefix):
+                break
+            results.append(value)
+            i += 1
+        return results
+
+def parse_aliases(aliases):
+    '''
+    parse 'alias=name,alias2=name2' into a dict
+    '''
+    pairs = [pair.split('=', 1) for pair in (aliases or '').split(',') if '=' in pair]
+    return {alias.strip(): name.strip() for alias, name in pairs}
+
+class ResolutionIndex:
+    '''
+    maps ids, <@id> mentions, names, display names and aliases to member ids;
+    exact lookups are a dict hit, fuzzy lookups only score the members in one
+    (first letter, length) bucket and never more than MAX_FUZZY_CANDIDATES
+    '''
+    def __init__(self, members=(), aliases=None):
+        '''
+        init
+        '''
+        self.exact = {}
+        self.buckets = {}
+        self.keys = {}
+        self.aliases = {}
+        for member in members:
+            self.add(member)
+        for alias, name in (aliases or {}).items():
+            self.alias(alias, name)
+
+    @staticmethod
+    def names(member):
+        '''
+        the names a member can be referred to by
+        '''
+        profile = member.get('profile') or {}
+        names = [member.get('name'), profile.get('display_name'), profile.get('display_name_normalized')]
+        return {name.lower() for name in names if name}
+
+    def _index(self, key, member_id):
+        '''
+        _index
+        '''
+        self.exact[key] = member_id
+        self.keys.setdefault(member_id, set()).add(key)
+        self.buckets.setdefault((key[0], len(key)), set()).add(key)
+
+    def _unindex(self, key, member_id):
+        '''
+        _unindex
+        '''
+        if self.exact.get(key) != member_id:
+            return # the key now belongs to another member
+        del self.exact[key]
+        bucket = self.buckets.get((key[0], len(key)))
+        if bucket:
+            bucket.discard(key)
+
+    def add(self, member):
+        '''
+        add or update a member
+        '''
+        member_id = member['id']
+        self.remove(member_id)
+        self.exact[member_id.lower()] = member_id
+        self.keys.setdefault(member_id, set()).add(member_id.lower())
+        for name in self.names(member):
+            self._index(name, member_id)
+        for alias, name in self.aliases.items():
+            if name.lower() in self.names(member):
+                self._index(alias, member_id)
+
+    def remove(self, member_id):
+        '''
+        remove
+        '''
+        for key in self.keys.pop(member_id, ()):
+            self._unindex(key, member_id)
+
+    def alias(self, alias, name):
+        '''
+        add a custom alias for the member called name
+        '''
+        alias = alias.lower()
+        self.aliases[alias] = name
+        member_id = self.exact.get(name.lower())
+        if member_id:
+            self._index(alias, member_id)
+
+    def resolve(self, token, fuzzy=True, cutoff=DEFAULT_FUZZY_CUTOFF):
+        '''
+        member id for token, or None
+        '''
+        if not token:
+            return None
+        match = mention_regex.match(token)
+        if match:
+            token = match.group('id')
+        key = token.lower()
+        member_id = self.exact.get(key)
+        if member_id or not fuzzy:
+            return member_id
+        from difflib import SequenceMatcher
+        best, best_ratio = None, cutoff
+        candidates = 0
+        for length in (len(key), len(key) - 1, len(key) + 1, len(key) - 2, len(key) + 2):
+            for candidate in self.buckets.get((key[0], length), ()):
+                ratio = SequenceMatcher(None, key, candidate).ratio()
+                if ratio >= best_ratio:
+                    best, best_ratio = candidate, ratio
+                candidates += 1
+                if candidates >= MAX_FUZZY_CANDIDATES:
+                    return self.exact.get(best)
+        return self.exact.get(best)
+
+class Directory:
+    '''
+    cached users.list with prefix indexes over member and prop names
+    '''
+    def __init__(self, slack=None, ttl=DEFAULT_TTL, aliases=None, client=None, lookup=None):
+        '''
+        init; client, if given, is called for the slack client on every
+        refresh, and lookup for the one user facing lookups use (defaults
+        to client)
+        '''
+        self.slack = slack
+        self.client = client
+        self.lookup = lookup or client
+        self.ttl = ttl
+        self.aliases = aliases or {}
+        self.members = {}
+        self.names = PrefixIndex()
+        self.props = PrefixIndex()
+        self.index = ResolutionIndex(aliases=self.aliases)
+        self.channels = {}
+        self.confirmed = OrderedDict() # (channel, member_id) -> when, oldest first
+        self.loaded = 0
+
+    @property
+    def stale(self):
+        '''
+        stale
+        '''
+        return time.time() - self.loaded > self.ttl
+
+    @staticmethod
+    def slim(member):
+        '''
+        keep only the fields the directory needs
+        '''
+        profile = member.get('profile') or {}
+        return dict(
+            id=member['id'],
+            name=member['name'],
+            deleted=member.get('deleted', False),
+            profile=dict(
+                display_name=profile.get('display_name'),
+                display_name_normalized=profile.get('display_name_normalized')))
+
+    def load(self, members):
+        '''
+        replace the cached members and rebuild the indexes from an iterable,
+        which may be a generator streaming pages
+        '''
+        cache, names, index = {}, [], ResolutionIndex(aliases=self.aliases)
+        for member in members:
+            if member.get('deleted'):
+                continue
+            member = self.slim(member)
+            cache[member['id']] = member
+            names.append((member['name'], member['name']))
+            index.add(member)
+        self.members = cache
+        self.names = PrefixIndex(names)
+        self.index = index
+        self.loaded = time.time()
+
+    def set_aliases(self, aliases):
+        '''
+        replace the aliases, rebuilding the resolution index if they changed
+        '''
+        if aliases != self.aliases:
+            self.aliases = aliases
+            self.index = ResolutionIndex(self.members.values(), aliases)
+
+    def upsert(self, member):
+        '''
+        apply a user_change or team_join member without a full reload; only
+        the slimmed member is kept, as load() does
+        '''
+        old = self.members.pop(member['id'], None)
+        if old:
+            self.names.remove(old['name'])
+            self.index.remove(old['id'])
+        if member.get('deleted'):
+            return
+        member = self.slim(member)
+        self.members[member['id']] = member
+        self.names.add(member['name'])
+        self.index.add(member)
+
+    def resolve(self, token, fuzzy=True):
+        '''
+        the cached member token refers to, or None
+        '''
+        return self.members.get(self.index.resolve(token, fuzzy=fuzzy))
+
+    def cached(self, channel, member_id):
+        '''
+        was member_id confirmed in channel within the ttl?
+        '''
+        confirmed = self.confirmed.get((channel, member_id))
+        return confirmed is not None and time.time() - confirmed < self.ttl
+
+    def settle(self, channel, member_id, result):
+        '''
+        remember what slack said about member_id in channel; returns it
+        '''
+        members = self.channels.setdefault(channel, set())
+        if result:
+            members.add(member_id)
+            now = time.time()
+            self.confirmed[(channel, member_id)] = now
+            self.confirmed.move_to_end((channel, member_id))
+            self.prune(now)
+        else:
+            members.discard(member_id)
+            self.confirmed.pop((channel, member_id), None)
+        return result
+
+    def last_known(self, channel, member_id, ex):
+        '''
+        the last known membership, for when slack is unavailable
+        '''
+        log.warning(f'serving stale membership for {channel}: {ex}')
+        return member_id in self.channels.get(channel, ())
+
+    def in_channel(self, channel, member_id, check):
+        '''
+        is member_id in channel? confirmations younger than the ttl come from
+        the cache; otherwise check(member_id) against slack, remembering
+        confirmed members so the answer can be served stale when slack is
+        unavailable. everything runs on the calling thread
+        '''
+        if self.cached(channel, member_id):
+            return True
+        try:
+            result = check(member_id)
+        except (CircuitOpenError, SlackUnavailableError) as ex:
+            return self.last_known(channel, member_id, ex)
+        return self.settle(channel, member_id, result)
+
+    async def ain_channel(self, channel, member_id, check):
+        '''
+        in_channel for the loop thread: only the blocking check runs in the
+        executor, the caches are read and updated here, so prune and
+        move_to_end never race another thread
+        '''
+        if self.cached(channel, member_id):
+            return True
+        loop = asyncio.get_event_loop()
+        try:
+            result = await loop.run_in_executor(None, check, member_id)
+        except (CircuitOpenError, SlackUnavailableError) as ex:
+            return self.last_known(channel, member_id, ex)
+        return self.settle(channel, member_id, result)
+
+    def prune(self, now):
+        '''
+        drop confirmations older than the ttl; they are kept oldest first,
+        so this stops at the first live one
+        '''
+        confirmed = self.confirmed
+        while confirmed:
+            key, when = next(iter(confirmed.items()))
+            if now - when < self.ttl:
+                break
+            del confirmed[key]
+
+    def add_prop(self, prop):
+        '''
+        add_prop
+        '''
+        if prop:
+            self.props.add(prop)
+
+    def seed_props(self, props):
+        '''
+        rebuild the prop index from the props already known plus props, in one
+        sort instead of one insort per prop
+        '''
+        known = {value for _, value in self.props.keys}
+        known.update(prop for prop in props if prop)
+        self.props = PrefixIndex((prop, prop) for prop in known)
+
+    def refresh(self):
+        '''
+        refresh from users.list, a page at a time
+        '''
+        slack = self.client() if self.client else self.slack
+        self.load(member for page in pages(slack, 'users.list', 'members') for member in page)
+
+    async def arefresh(self):
+        '''
+        refresh without blocking the loop; pages are fetched in an executor
+        and the old cache keeps serving until the new one is complete
+        '''
+        slack = self.client() if self.client else self.slack
+        members = []
+        async for page in apages(slack, 'users.list', 'members'):
+            members.extend(self.slim(member) for member in page if not member.get('deleted'))
+        self.load(members)
+
+    async def afind(self, token, fuzzy=False):
+        '''
+        resolve token by streaming users.list until it turns up, caching the
+        members seen on the way; for lookups before the first refresh lands.
+        exact by default, since the caller usually writes to whoever it gets
+        '''
+        member = self.resolve(token, fuzzy=False)
+        if member:
+            return member
+        slack = self.lookup() if self.lookup else self.slack
+        try:
+            async for member in apaginate(slack, 'users.list', 'members'):
+                if not member.get('deleted') and member['id'] not in self.members:
+                    self.upsert(member)
+                    found = self.resolve(token, fuzzy=False)
+                    if found:
+                        return found
+        except (CircuitOpenError, SlackUnavailableError, RateLimitExceededError) as ex:
+            log.warning(f'serving stale directory: {ex}')
+        return self.resolve(token, fuzzy=fuzzy)
+
+    async def keep_fresh(self, interval=None):
+        '''
+        refresh every interval seconds (defaults to the ttl)
+        '''
+        while True:
+            try:
+                await self.arefresh()
+            except Exception as ex: #pylint: disable=broad-except
+                log.error(f'directory refresh raised {ex}')
+            await asyncio.sleep(interval or self.ttl)
+
+    def options(self, kind, prefix, limit=DEFAULT_LIMIT):
+        '''
+        message menu options for member or prop names starting with prefix
+        '''
+        index = self.props if kind == 'props_prop' else self.names
+        return [dict(text=value, value=value) for value in index.search(prefix, limit)]
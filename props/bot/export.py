@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+streaming props export as ndjson or csv
+'''
+
+import io
+import csv
+import time
+import asyncio
+
+from datetime import datetime
+
+import jsonenc
+
+DEFAULT_CHUNK_ROWS = 1000
+COLUMNS = ('name', 'prop', 'value', 'updated')
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+TIME_FORMATS = (
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M',
+    '%Y-%m-%d',
+)
+
+class ExportFormatError(Exception):
+    '''
+    ExportFormatError
+    '''
+    def __init__(self, fmt):
+        '''
+        init
+        '''
+        msg = f'unknown export format {fmt}; choose from {", ".join(FORMATS)}'
+        super(ExportFormatError, self).__init__(msg)
+
+class ExportTimeError(Exception):
+    '''
+    ExportTimeError
+    '''
+    def __init__(self, value):
+        '''
+        init
+        '''
+        msg = f'expected epoch seconds or YYYY-MM-DD[THH:MM[:SS]] (UTC); value = {value}'
+        super(ExportTimeError, self).__init__(msg)
+
+def parse_time(value):
+    '''
+    epoch seconds or a UTC timestamp into epoch seconds; None passes through
+    '''
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in TIME_FORMATS:
+        try:
+            return (datetime.strptime(value, fmt) - datetime(1970, 1, 1)).total_seconds()
+        except ValueError:
+            continue
+    raise ExportTimeError(value)
+
+def ndjson_rows(rows):
+    '''
+    ndjson_rows
+    '''
+    for name, prop, value, updated in rows:
+        yield jsonenc.dumps(dict(name=name, prop=prop, value=value, updated=updated))
+
+def csv_rows(rows, chunk_rows=DEFAULT_CHUNK_ROWS):
+    '''
+    csv_rows, encoded a chunk at a time through one reused buffer
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count == chunk_rows:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    yield buffer.getvalue().encode('utf-8')
+
+async def export(table, fmt='ndjson', chunk_rows=DEFAULT_CHUNK_ROWS, **filters):
+    '''
+    async generator of byte chunks; yields to the loop between chunks so a
+    big export never blocks event handling
+    '''
+    if fmt not in FORMATS:
+        raise ExportFormatError(fmt)
+    rows = table.rows(**filters)
+    if fmt == 'csv':
+        for chunk in csv_rows(rows, chunk_rows):
+            if chunk:
+                yield chunk
+            await asyncio.sleep(0)
+        return
+    chunk = []
+    for line in ndjson_rows(rows):
+        chunk.append(line)
+        if len(chunk) == chunk_rows:
+            yield b''.join(chunk)
+            chunk = []
+            await asyncio.sleep(0)
+    if chunk:
+        yield b''.join(chunk)
+
+def filename(fmt):
+    '''
+    filename
+    '''
+    return f'props-{time.strftime("%Y%m%dT%H%M%S", time.gmtime())}.{fmt}'
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+json encoding for responses: orjson when it is installed, stdlib otherwise;
+compact unless pretty is asked for, always bytes with a trailing newline
+'''
+
+import json
+
+from collections import OrderedDict
+
+def orjson_encoder():
+    '''
+    orjson_encoder
+    '''
+    import orjson
+    compact = orjson.OPT_NON_STR_KEYS
+    pretty = compact | orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+    newline = getattr(orjson, 'OPT_APPEND_NEWLINE', None)
+    if newline:
+        compact, pretty = compact | newline, pretty | newline
+        return lambda obj, indent: orjson.dumps(obj, option=pretty if indent else compact)
+    return lambda obj, indent: orjson.dumps(obj, option=pretty if indent else compact) + b'\n'
+
+def stdlib_encoder():
+    '''
+    stdlib_encoder
+    '''
+    compact = json.JSONEncoder(separators=(',', ':'))
+    pretty = json.JSONEncoder(indent=4, sort_keys=True)
+    return lambda obj, indent: ((pretty if indent else compact).encode(obj) + '\n').encode('utf-8')
+
+ENCODERS = OrderedDict([
+    ('orjson', orjson_encoder),
+    ('stdlib', stdlib_encoder),
+])
+
+class UnknownEncoderError(Exception):
+    '''
+    UnknownEncoderError
+    '''
+    def __init__(self, name):
+        '''
+        init
+        '''
+        msg = f'unknown json encoder {name}; choose from auto, {", ".join(ENCODERS)}'
+        super(UnknownEncoderError, self).__init__(msg)
+
+ENCODER = None
+ENCODER_NAME = None
+
+def use(name='auto'):
+    '''
+    select an encoder by name; auto picks the first one that imports
+    '''
+    global ENCODER, ENCODER_NAME #pylint: disable=global-statement
+    if name != 'auto' and name not in ENCODERS:
+        raise UnknownEncoderError(name)
+    for candidate in (ENCODERS if name == 'auto' else [name]):
+        try:
+            ENCODER, ENCODER_NAME = ENCODERS[candidate](), candidate
+            return candidate
+        except ImportError:
+            continue
+    raise UnknownEncoderError(name)
+
+def register(name, factory):
+    '''
+    add an encoder factory, returning a callable(obj, pretty) -> bytes, ahead
+    of the built in ones
+    '''
+    ENCODERS[name] = factory
+    ENCODERS.move_to_end(name, last=False)
+
+def dumps(obj, pretty=False):
+    '''
+    obj as json bytes ending in a newline
+    '''
+    if ENCODER is None:
+        use()
+    return ENCODER(obj, pretty)
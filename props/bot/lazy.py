@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+thin wrappers that import their dependency on first call, keeping it off the
+cold start path
+'''
+
+def attrdict(obj):
+    '''
+    attrdict.AttrDict
+    '''
+    from attrdict import AttrDict
+    return AttrDict(obj)
+
+def dbg(*args, **kwargs):
+    '''
+    utils.dbg.dbg
+    '''
+    from utils.dbg import dbg as _dbg
+    return _dbg(*args, **kwargs)
+
+def merge(*args, **kwargs):
+    '''
+    utils.dictionary.merge
+    '''
+    from utils.dictionary import merge as _merge
+    return _merge(*args, **kwargs)
@@ -5,19 +5,28 @@ props bot
 '''
 
 import os
+import asyncio
 
-from json import dumps
-from ruamel import yaml
+from datetime import datetime
+from functools import partial
+from json import dumps, loads, load
 from quart import abort, Quart, request, Response
 from quart.helpers import make_response
-from attrdict import AttrDict
-from slackclient import SlackClient
 
-from utils.dbg import dbg
-from utils.dictionary import merge
-from cfg import CFG
+import jsonenc
+import snapshot
+import commands
+from lazy import attrdict, dbg, merge
+from cfg import CFG, ReloadableConfig
+from socketmode import SocketModeClient
+from teams import Teams, RateLimitExceededError
+from resilience import CircuitOpenError, SlackUnavailableError
+from digest import Cron, RunMarker
+from profiling import Profiler, ProfileSortError
+from deferred import Deferred
+from export import export, filename, parse_time, FORMATS, ExportFormatError, ExportTimeError
 
-from propsbot import PropsBot
+from propsbot import PropsBot, PropsFilter, prop_regex
 
 app = Quart(__name__)
 
@@ -25,15 +34,36 @@ app = Quart(__name__)
 SCRIPT_FILE = os.path.abspath(__file__)
 SCRIPT_NAME = os.path.basename(SCRIPT_FILE)
 SCRIPT_PATH = os.path.dirname(SCRIPT_FILE)
-CONTRIBUTE_JSON = yaml.safe_load(open(f'{SCRIPT_PATH}/contribute.json'))
+CONTRIBUTE_JSON = {}
+
+CONFIG = ReloadableConfig(SCRIPT_PATH)
+
+TEAMS = Teams()
+CONFIG.subscribe(TEAMS.configure)
+
+CONFIG.subscribe(lambda settings: jsonenc.use(settings.PROPS_BOT_JSON_ENCODER))
+
+PROFILER = Profiler()
+CONFIG.subscribe(lambda settings: PROFILER.configure(
+    settings.PROPS_BOT_PROFILE_SAMPLE_RATE,
+    settings.PROPS_BOT_ADMIN_TOKEN,
+    settings.PROPS_BOT_SLOW_REQUEST_MS))
+
+ADMIN_HEADER = 'X-Props-Admin-Token'
+
+FILTER = PropsFilter()
+
+DEFERRED = Deferred(CONFIG.snapshot.PROPS_BOT_DEFERRED_WORKERS)
 
 PROPS = {}
 
-async def jsonify(status=200, indent=4, sort_keys=True, **kwargs):
+async def jsonify(status=200, pretty=None, **kwargs):
     '''
-    async jsonify
+    async jsonify; compact bytes unless pretty or ?pretty is passed
     '''
-    response = await make_response(dumps(dict(**kwargs), indent=indent, sort_keys=sort_keys)+'\n')
+    if pretty is None:
+        pretty = 'pretty' in request.args
+    response = await make_response(jsonenc.dumps(kwargs, pretty))
     response.headers['Content-Type'] = 'application/json; charset=utf-8'
     response.headers['mimetype'] = 'application/json'
     response.status_code = status
@@ -47,7 +77,88 @@ def is_request_valid(token, team_id):
     '''
     is_request_valid
     '''
-    return token == CFG.SLACK_VERIFICATION_TOKEN and team_id == CFG.SLACK_TEAM_ID
+    return TEAMS.is_request_valid(token, team_id)
+
+def require_admin():
+    '''
+    admin routes 404 unless PROPS_BOT_ADMIN_TOKEN is set and presented
+    '''
+    token = CONFIG.snapshot.PROPS_BOT_ADMIN_TOKEN
+    if not token or request.headers.get(ADMIN_HEADER) != token:
+        abort(404)
+
+def get_team(token, team_id):
+    '''
+    the team a verified request belongs to; 400 otherwise
+    '''
+    if not is_request_valid(token, team_id):
+        abort(400)
+    return TEAMS.get(team_id)
+
+@app.before_serving
+async def startup():
+    '''
+    async startup
+    '''
+    CONFIG.install()
+    asyncio.ensure_future(CONFIG.watch())
+    TEAMS.subscribe(start_team)
+    asyncio.ensure_future(io_background_task())
+    if CONFIG.snapshot.PROPS_BOT_SOCKET_MODE:
+        client = SocketModeClient(
+            CONFIG.snapshot.SLACK_APP_TOKEN,
+            lambda payload: handle_event(attrdict(payload)),
+            responders=dict(slash_commands=socket_command, interactive=socket_interaction))
+        asyncio.ensure_future(client.run())
+
+def start_team(team):
+    '''
+    warm start a team and keep its directory, snapshot and stored props up to date;
+    runs for the teams at boot and for every team a config reload adds
+    '''
+    path = snapshot_path(team)
+    if snapshot.restore(team.directory, path, team.digest):
+        app.logger.info(f'warm start for {team.team_id}: {len(team.directory.members)} members from {path}')
+    team.directory.seed_props(prop for _, prop, _ in team.props.items())
+    asyncio.ensure_future(team.directory.keep_fresh())
+    asyncio.ensure_future(snapshot.keep_saved(
+        team.directory, path, CONFIG.snapshot.PROPS_BOT_SNAPSHOT_INTERVAL, team.digest))
+    asyncio.ensure_future(team.keep_flushed(CONFIG.snapshot.PROPS_BOT_FLUSH_INTERVAL))
+
+@app.after_serving
+async def shutdown():
+    '''
+    async shutdown: spill stored props and leave a fresh snapshot for
+    the next boot
+    '''
+    for team in TEAMS:
+        team.close()
+        if team.directory.loaded:
+            snapshot.save(team.directory, snapshot_path(team), team.digest)
+
+def snapshot_path(team):
+    '''
+    snapshot_path
+    '''
+    return os.path.join(CONFIG.snapshot.PROPS_BOT_STATE_PATH, f'directory.{team.team_id}.snap')
+
+async def find_member(team, name):
+    '''
+    the directory member name refers to exactly, or None; props are never
+    credited to a fuzzy match
+    '''
+    if team.directory.loaded:
+        return team.directory.resolve(name, fuzzy=False)
+    return await team.directory.afind(name)
+
+async def get_payload():
+    '''
+    interactive payloads arrive form encoded as payload=<json>
+    '''
+    form = await request.form
+    if 'payload' in form:
+        return attrdict(loads(form['payload']))
+    return attrdict(await request.get_json(silent=True) or {})
 
 @app.route('/version', methods=['GET'])
 async def version():
@@ -61,6 +172,9 @@ async def contribute_json():
     '''
     async contribute.json route
     '''
+    if not CONTRIBUTE_JSON:
+        with open(f'{SCRIPT_PATH}/contribute.json') as f:
+            CONTRIBUTE_JSON.update(load(f))
     json = merge(CONTRIBUTE_JSON, dict(
         repository=dict(
             version=CFG.APP_VERSION,
@@ -69,61 +183,284 @@ async def contribute_json():
     return response
 
 @app.route('/props-bot', methods=['POST'])
+@PROFILER.profile('props_bot')
 async def props_bot():
     '''
     async props_bot slash command route
     '''
-    form = await request.form.to_dict()
-    form = AttrDict(form)
-    if not is_request_valid(form.token, form.team_id):
-        abort(400)
+    form = (await request.form).to_dict()
+    form = attrdict(form)
+    team = get_team(form.token, form.team_id)
+    return await jsonify(**command_response(team, form))
 
-    return 'wazzup playa?', 200
+def command_response(team, form):
+    '''
+    the response body for a slash command, from a webhook or socket mode
+    '''
+    func, args = commands.parse(form.get('text'))
+    if func is None:
+        return commands.ephemeral(commands.USAGE)
+    if not form.get('response_url'):
+        return commands.run(func, team, form.get('channel_id'), args)
+    DEFERRED.submit(form.response_url, partial(commands.steps, func, team, form.get('channel_id'), args))
+    return commands.ephemeral('working…')
 
 @app.route('/slack/interactivity', methods=['POST'])
+@PROFILER.profile('slack_interactivity')
 async def slack_interactivity():
     '''
     async slack_interactivity route
     '''
-    json = await request.get_json(silent=True)
-    json = AttrDict(json)
-    return Response('', status=200)
+    json = await get_payload()
+    team = get_team(json.get('token'), json.get('team', {}).get('id'))
+    body = await interaction_response(team, json)
+    if body is None:
+        return Response('', status=200)
+    return await jsonify(**body)
+
+async def interaction_response(team, json):
+    '''
+    the response body for an interactive payload, or None
+    '''
+    for action in (json.actions if 'actions' in json else ()):
+        if action.name == 'give_props':
+            name, _, prop = action.value.partition(':')
+            member = await find_member(team, name)
+            if member is None or (prop and not prop_regex.match(prop)):
+                return dict(
+                    response_type='ephemeral',
+                    replace_original=False,
+                    text=f'can\'t give props to {action.value}')
+            name = member['name']
+            value, _ = team.add(json.get('channel', {}).get('id'), name, prop or None, 1)
+            team.directory.add_prop(prop)
+            return dict(
+                response_type='in_channel',
+                replace_original=False,
+                text=f'{name}:{prop or None} => {value}')
+        if action.name == 'props_user':
+            name = action.selected_options[0].value
+            buttons = [
+                dict(name='give_props', text=f'{prop}++', type='button', value=f'{name}:{prop}')
+                for prop in team.props.user_props(name) if prop
+            ][:5]
+            return dict(
+                response_type='ephemeral',
+                replace_original=False,
+                text=f'give {name} props for',
+                attachments=[dict(callback_id='give_props', actions=buttons)])
+    return None
 
 @app.route('/slack/message-menus', methods=['POST'])
+@PROFILER.profile('slack_message_menus')
 async def slack_message_menus():
     '''
     async slack_message_menus route
     '''
-    json = await request.get_json(silent=True)
-    json = AttrDict(json)
-    return Response('', status=200)
+    json = await get_payload()
+    team = get_team(json.get('token'), json.get('team', {}).get('id'))
+    return await jsonify(options=team.directory.options(json.get('name'), json.get('value')))
 
 @app.route('/slack/events', methods=['POST'])
+@PROFILER.profile('slack_events')
 async def slack_events():
     '''
     async slack_events route
     '''
     print('*'*80)
     json = await request.get_json(silent=True)
-    json = AttrDict(json)
+    with PROFILER.section('attrdict'):
+        json = attrdict(json)
     if 'challenge' in json:
         return json.challenge, 200
-    if json.event.channel != CFG.PROPS_BOT_CHANNEL_ID and 'text' in json.event:
-        return Response('', status=200)
+    await handle_event(json)
+    return Response('', status=200)
+
+async def socket_command(payload):
+    '''
+    socket mode slash commands; the websocket is already authenticated
+    '''
+    form = attrdict(payload)
+    team = TEAMS.get(form.get('team_id'))
+    return None if team is None else command_response(team, form)
+
+async def socket_interaction(payload):
+    '''
+    socket mode interactive payloads
+    '''
+    json = attrdict(payload)
+    team = TEAMS.get(json.get('team', {}).get('id'))
+    return None if team is None else await interaction_response(team, json)
+
+async def handle_event(json):
+    '''
+    process an event_callback, whether it came from a webhook or socket mode
+    '''
+    team = TEAMS.get(json.get('team_id'))
+    if team is None:
+        return
+    if json.event.type in ('user_change', 'team_join'):
+        team.directory.upsert(json.event.user)
+        return
+    if 'text' in json.event and not team.allows(json.event.channel):
+        return
     if json.event.get('username', None) == 'props':
-        return Response('', status=200)
+        return
+    operation = FILTER.operation(json.event.get('text'))
+    if operation is None:
+        return
 
     dbg(event=json.event)
-    slack = SlackClient(CFG.BOT_USER_OAUTH_ACCESS_TOKEN)
-    bot = PropsBot(slack, json.event)
-    name, prop, operator, operand = bot.parse()
+    name, prop, operator, operand = operation
     dbg(name, prop, operator, operand)
-    if name in bot.members_in_channel:
-        bot.update(name, prop, operator, operand)
-    return Response('', status=200)
+    bot = PropsBot(team.request_slack(), json.event, team.props)
+    with PROFILER.section('directory'):
+        member = await find_member(team, name)
+    loop = asyncio.get_event_loop()
+    try:
+        if member is None:
+            suggestion = team.directory.resolve(name)
+            if suggestion and json.event.get('user'):
+                with PROFILER.section('slack'):
+                    await loop.run_in_executor(
+                        None, bot.whisper, f'no one called {name}; did you mean {suggestion["name"]}?')
+            return
+        with PROFILER.section('slack'):
+            in_channel = await team.directory.ain_channel(bot.channel, member['id'], bot.in_channel)
+        if in_channel:
+            with PROFILER.section('update'):
+                value, _ = team.add(bot.channel, member['name'], prop, PropsBot.delta(operator, operand))
+            team.directory.add_prop(prop)
+            with PROFILER.section('slack'):
+                await loop.run_in_executor(None, bot.send, PropsBot.format(member['name'], prop, value))
+    except (RateLimitExceededError, CircuitOpenError, SlackUnavailableError) as ex:
+        app.logger.warning(ex)
+
+def get_props(args):
+    '''
+    the ?team's global props, or one channel's with ?channel; 404 otherwise
+    '''
+    team = TEAMS.get(args.get('team', CONFIG.snapshot.SLACK_TEAM_ID))
+    if team is None:
+        abort(404)
+    channel = args.get('channel')
+    if channel is None:
+        return team.props
+    if not team.allows(channel):
+        abort(404)
+    return team.channel_props(channel)
+
+@app.route('/props/export', methods=['GET'])
+async def props_export():
+    '''
+    async props_export route: streams ?format=ndjson|csv, filtered by
+    ?channel, ?user, ?prop and ?since/?until (on each cell's last update)
+    '''
+    require_admin()
+    args = request.args
+    props = get_props(args)
+    fmt = args.get('format', 'ndjson')
+    try:
+        if fmt not in FORMATS:
+            raise ExportFormatError(fmt)
+        chunks = export(
+            props,
+            fmt,
+            name=args.get('user'),
+            prop=args.get('prop'),
+            since=parse_time(args.get('since')),
+            until=parse_time(args.get('until')))
+    except (ExportFormatError, ExportTimeError) as ex:
+        return await jsonify(status=400, error=str(ex))
+    response = Response(chunks, mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename(fmt)}"'
+    return response
+
+@app.route('/props/leaderboard', methods=['GET'])
+async def props_leaderboard():
+    '''
+    async props_leaderboard route: top ?count cells, for one ?channel or
+    globally, optionally of one ?prop
+    '''
+    require_admin()
+    args = request.args
+    props = get_props(args)
+    try:
+        count = int(args.get('count', 10))
+    except ValueError:
+        return await jsonify(status=400, error=f'count must be an integer; count = {args.get("count")}')
+    top = props.top(count, args.get('prop'))
+    return await jsonify(leaderboard=[dict(name=name, prop=prop, value=value) for name, prop, value in top])
+
+@app.route('/admin/filter', methods=['GET'])
+async def admin_filter():
+    '''
+    async admin_filter route: message counts dropped at each filter stage
+    '''
+    require_admin()
+    return await jsonify(**FILTER.counts)
+
+@app.route('/admin/profiles', methods=['GET'])
+async def admin_profiles():
+    '''
+    async admin_profiles route: recent profiled and slow requests
+    '''
+    require_admin()
+    return await jsonify(captures=[capture.summary() for capture in PROFILER.captures])
+
+@app.route('/admin/profiles/<int:capture_id>', methods=['GET'])
+async def admin_profile(capture_id):
+    '''
+    async admin_profile route: pstats report for one capture
+    '''
+    require_admin()
+    capture = PROFILER.get(capture_id)
+    if capture is None:
+        abort(404)
+    try:
+        stats = capture.stats(request.args.get('sort', 'cumulative'))
+    except ProfileSortError as ex:
+        return await jsonify(status=400, error=str(ex))
+    return Response(stats or dumps(capture.summary(), indent=4), mimetype='text/plain')
+
+async def post_digest(team, marker, when, count):
+    '''
+    post one team's digest for the run at when, unless someone already has;
+    either way the period rolls over once the run is settled
+    '''
+    if team.digest.rolled is not None and when <= team.digest.rolled:
+        return
+    name = f'digest-{team.team_id}'
+    if not marker.claim(name, when):
+        team.digest.roll(when)
+        return
+    message = team.digest.message(count, when)
+    if message:
+        loop = asyncio.get_event_loop()
+        try:
+            result = await loop.run_in_executor(
+                None,
+                partial(team.slack.api_call, 'chat.postMessage', channel=team.channel_id, text=message))
+        except Exception as ex: #pylint: disable=broad-except
+            result = dict(ok=False, error=str(ex))
+        if not result.get('ok'):
+            marker.release(name, when)
+            app.logger.error(f'digest for {team.team_id} failed; result = {result}')
+            return
+    team.digest.roll(when)
 
 async def io_background_task():
     '''
-    async io_background_task
+    async io_background_task: wakes every minute and posts the scheduled
+    digests; a run missed by a restart is still posted within the grace window
     '''
-    raise NotImplementedError
+    marker = RunMarker(CONFIG.snapshot.PROPS_BOT_STATE_PATH)
+    while True:
+        now = datetime.utcnow()
+        await asyncio.sleep(60 - now.second - now.microsecond / 1e6)
+        settings = CONFIG.snapshot
+        when = Cron(settings.PROPS_BOT_DIGEST_CRON).latest(datetime.utcnow())
+        if when is None:
+            continue
+        for team in TEAMS:
+            await post_digest(team, marker, when, settings.PROPS_BOT_DIGEST_TOP)
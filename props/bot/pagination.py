@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+cursor pagination over slack web api methods; one page in memory at a time
+'''
+
+import asyncio
+
+from functools import partial
+
+DEFAULT_PAGE_SIZE = 200
+
+class PaginationError(Exception):
+    '''
+    PaginationError
+    '''
+    def __init__(self, method, json):
+        '''
+        init
+        '''
+        msg = f'{method} error; json = {json}'
+        super(PaginationError, self).__init__(msg)
+
+def next_cursor(json):
+    '''
+    next_cursor
+    '''
+    return (json.get('response_metadata') or {}).get('next_cursor') or None
+
+def pages(slack, method, key, error=None, limit=DEFAULT_PAGE_SIZE, **kwargs):
+    '''
+    yield the key list of every page of method
+    '''
+    params = dict(kwargs, limit=limit)
+    while True:
+        json = slack.api_call(method, **params)
+        if key not in json:
+            raise (error or partial(PaginationError, method))(json)
+        yield json[key]
+        params['cursor'] = next_cursor(json)
+        if not params['cursor']:
+            return
+
+def paginate(slack, method, key, error=None, limit=DEFAULT_PAGE_SIZE, **kwargs):
+    '''
+    yield the items of every page of method
+    '''
+    for page in pages(slack, method, key, error, limit, **kwargs):
+        yield from page
+
+async def apages(slack, method, key, error=None, limit=DEFAULT_PAGE_SIZE, **kwargs):
+    '''
+    async pages; each blocking api_call runs in the default executor
+    '''
+    loop = asyncio.get_event_loop()
+    params = dict(kwargs, limit=limit)
+    while True:
+        json = await loop.run_in_executor(None, partial(slack.api_call, method, **params))
+        if key not in json:
+            raise (error or partial(PaginationError, method))(json)
+        yield json[key]
+        params['cursor'] = next_cursor(json)
+        if not params['cursor']:
+            return
+
+async def apaginate(slack, method, key, error=None, limit=DEFAULT_PAGE_SIZE, **kwargs):
+    '''
+    async paginate
+    '''
+    async for page in apages(slack, method, key, error, limit, **kwargs):
+        for item in page:
+            yield item
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+opt-in request profiling and slow request capture
+'''
+
+import io
+import sys
+import time
+import random
+import asyncio
+import itertools
+import threading
+import traceback
+
+from collections import deque
+from functools import wraps
+from contextlib import contextmanager
+
+PROFILE_HEADER = 'X-Props-Profile'
+DEFAULT_KEEP = 50
+
+class ProfileSortError(Exception):
+    '''
+    ProfileSortError
+    '''
+    def __init__(self, sort, keys):
+        '''
+        init
+        '''
+        msg = f'sort must be one of {", ".join(sorted(keys))}; sort = {sort}'
+        super(ProfileSortError, self).__init__(msg)
+
+current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task #pylint: disable=no-member
+
+class Capture:
+    '''
+    one captured request: timings, an optional cProfile and the stack seen
+    by the watchdog if the request overran the slow threshold
+    '''
+    ids = itertools.count(1)
+
+    def __init__(self, route):
+        '''
+        init
+        '''
+        self.id = next(Capture.ids)
+        self.route = route
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.sections = {}
+        self.profile = None
+        self.stack = None
+        self.thread_id = threading.get_ident()
+
+    def summary(self):
+        '''
+        summary
+        '''
+        return dict(
+            id=self.id,
+            route=self.route,
+            started=self.started,
+            elapsed_ms=round(self.elapsed * 1000, 3) if self.elapsed is not None else None,
+            sections_ms={name: round(elapsed * 1000, 3) for name, elapsed in self.sections.items()},
+            profiled=self.profile is not None,
+            stack=self.stack)
+
+    def stats(self, sort='cumulative', limit=50):
+        '''
+        pstats report as text; sort is one of the pstats sort key strings
+        '''
+        import pstats
+        keys = pstats.Stats.sort_arg_dict_default
+        if sort not in keys:
+            raise ProfileSortError(sort, keys)
+        if self.profile is None:
+            return ''
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+class Profiler:
+    '''
+    Profiler; when neither sampling, the header token nor the slow threshold
+    is configured, a wrapped route costs one attribute check
+    '''
+    def __init__(self, sample_rate=0.0, token='', slow_ms=0, keep=DEFAULT_KEEP):
+        '''
+        init
+        '''
+        self.captures = deque(maxlen=keep)
+        self.active = {}
+        self.tasks = {}
+        self.profiling = False
+        self.watchdog = None
+        self.configure(sample_rate, token, slow_ms)
+
+    def configure(self, sample_rate=0.0, token='', slow_ms=0):
+        '''
+        configure
+        '''
+        self.sample_rate = sample_rate
+        self.token = token
+        self.slow = slow_ms / 1000.0
+        self.enabled = bool(sample_rate or token or slow_ms)
+        if self.slow and self.watchdog is None:
+            self.watchdog = threading.Thread(target=self.watch, name='profiler-watchdog', daemon=True)
+            self.watchdog.start()
+
+    def wanted(self, headers):
+        '''
+        profile this request?
+        '''
+        if self.profiling:
+            return False # cProfile sees the whole loop; one at a time
+        if self.token and headers.get(PROFILE_HEADER) == self.token:
+            return True
+        return random.random() < self.sample_rate
+
+    def profile(self, route):
+        '''
+        decorator for async route handlers
+        '''
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+                from quart import request
+                return await self.run(route, request.headers, func, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    async def run(self, route, headers, func, *args, **kwargs):
+        '''
+        run func under a Capture
+        '''
+        capture = Capture(route)
+        if self.wanted(headers):
+            import cProfile
+            capture.profile = cProfile.Profile()
+            self.profiling = True
+            capture.profile.enable()
+        self.active[capture.id] = capture
+        task = current_task()
+        self.tasks[task] = capture
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            del self.tasks[task]
+            capture.elapsed = time.perf_counter() - capture.start
+            del self.active[capture.id]
+            if capture.profile:
+                capture.profile.disable()
+                self.profiling = False
+            if capture.profile or (self.slow and capture.elapsed >= self.slow):
+                self.captures.append(capture)
+
+    @contextmanager
+    def section(self, name):
+        '''
+        time a section of the current request; a no-op outside of one
+        '''
+        capture = self.tasks.get(current_task()) if self.tasks else None
+        if capture is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            capture.sections[name] = capture.sections.get(name, 0) + time.perf_counter() - start
+
+    def watch(self):
+        '''
+        watchdog thread: grab the stack of any request past the threshold,
+        which catches blocking calls stalling the event loop
+        '''
+        while self.slow:
+            time.sleep(self.slow / 2)
+            now = time.perf_counter()
+            frames = None
+            for capture in list(self.active.values()):
+                if capture.stack is None and now - capture.start >= self.slow:
+                    frames = frames or sys._current_frames() #pylint: disable=protected-access
+                    frame = frames.get(capture.thread_id)
+                    if frame is not None:
+                        capture.stack = traceback.format_stack(frame)
+        self.watchdog = None
+
+    def get(self, capture_id):
+        '''
+        get
+        '''
+        for capture in self.captures:
+            if capture.id == capture_id:
+                return capture
+        return None
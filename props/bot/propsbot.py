@@ -6,12 +6,19 @@ propsbot
 
 import re
 
-from attrdict import AttrDict
+from collections import Counter
 
-from utils.dbg import dbg
+from lazy import attrdict, dbg
+from table import PropsTable
+from pagination import paginate
 
 #pylint: disable=line-too-long
-parse_regex = re.compile(r'(?P<name>[A-Za-z0-9_-]+)(:(?P<prop>[A-Za-z0-9_-]+))?(?P<operator>\+\+|--|\+=|-=)?(?P<operand>[0-9])?')
+parse_regex = re.compile(r'(?P<name><@[A-Z0-9]+(\|[^>]*)?>|[A-Za-z0-9_.-]+)(:(?P<prop>[A-Za-z0-9_-]+))?(?P<operator>\+\+|--|[+-]=(?=[0-9]))?(?P<operand>[0-9])?')
+operation_regex = re.compile(r'(?P<name><@[A-Z0-9]+(\|[^>]*)?>|[A-Za-z0-9_.-]+)(:(?P<prop>[A-Za-z0-9_-]+))?(?P<operator>\+\+|--|[+-]=(?=[0-9]))(?P<operand>[0-9])?')
+
+prop_regex = re.compile(r'^[A-Za-z0-9_-]+$')
+
+OPERATOR_TOKENS = ('++', '--', '+=', '-=')
 
 class EventTextError(Exception):
     '''
@@ -68,11 +75,45 @@ class MembersListError(Exception):
         msg = f'users.list error; json = {json}'
         super(MembersListError, self).__init__(msg)
 
+class PropsFilter:
+    '''
+    staged filter for message text: a substring scan for an operator, then
+    the full parse; counts tell how much chatter each stage drops
+    '''
+    def __init__(self):
+        '''
+        init
+        '''
+        self.counts = Counter()
+
+    @staticmethod
+    def has_operator(text):
+        '''
+        cheap scan; no regex and no allocation for the common case
+        '''
+        return any(token in text for token in OPERATOR_TOKENS)
+
+    def operation(self, text):
+        '''
+        (name, prop, operator, operand) for props messages, None for the rest
+        '''
+        self.counts['seen'] += 1
+        if not text or not PropsFilter.has_operator(text):
+            self.counts['prefilter'] += 1
+            return None
+        match = operation_regex.search(text)
+        if match is None:
+            self.counts['parse'] += 1
+            return None
+        self.counts['passed'] += 1
+        d = match.groupdict()
+        return d['name'], d['prop'], d['operator'], d['operand']
+
 class PropsBot:
     '''
     PropsBot
     '''
-    props = {}
+    props = PropsTable()
 
     operators = {
         '++': lambda x, y: x + 1,
@@ -81,12 +122,13 @@ class PropsBot:
         '-=': lambda x, y: x - int(y),
     }
 
-    def __init__(self, slack, event):
+    def __init__(self, slack, event, props=None):
         '''
         init
         '''
         self.slack = slack
         self.event = event
+        self.props = PropsBot.props if props is None else props
 
     @property
     def has_connectivity(self):
@@ -123,7 +165,7 @@ class PropsBot:
         '''
         json = self.slack.api_call('channels.list')
         if 'channels' in json:
-            return [AttrDict(channel) for channel in json['channels']]
+            return [attrdict(channel) for channel in json['channels']]
         raise ChannelsListError(json)
 
     @property
@@ -133,25 +175,45 @@ class PropsBot:
         '''
         json = self.slack.api_call('channels.info', channel=self.channel)
         if 'channel' in json:
-            return AttrDict(json['channel'])
+            return attrdict(json['channel'])
         raise ChannelsInfoError(json)
 
     @property
     def members(self):
         '''
-        members
+        members, streamed a users.list page at a time
+        '''
+        return (attrdict(member) for member in paginate(self.slack, 'users.list', 'members', MembersListError))
+
+    @property
+    def channel_member_ids(self):
+        '''
+        channel member ids, streamed a conversations.members page at a time
         '''
-        json = self.slack.api_call('users.list')
-        if 'members' in json:
-            return [AttrDict(member) for member in json['members']]
-        raise MembersListError(json)
+        return paginate(self.slack, 'conversations.members', 'members', ChannelsInfoError, channel=self.channel)
 
     @property
     def members_in_channel(self):
         '''
         members_in_channel
         '''
-        return [member.name for member in self.members if member.id in self.channels_info.members]
+        member_ids = set(self.channel_member_ids)
+        return [member.name for member in self.members if member.id in member_ids]
+
+    def find_member(self, name):
+        '''
+        the member called name; stops fetching pages once found
+        '''
+        for member in self.members:
+            if member.name == name:
+                return member
+        return None
+
+    def in_channel(self, member_id):
+        '''
+        in_channel; stops fetching pages once member_id is seen
+        '''
+        return any(channel_member_id == member_id for channel_member_id in self.channel_member_ids)
 
     def parse(self, text=None):
         '''
@@ -169,16 +231,50 @@ class PropsBot:
         '''
         self.slack.api_call('chat.postMessage', channel=channel if channel else self.channel, text=message)
 
+    def whisper(self, message):
+        '''
+        send message to the event's author only
+        '''
+        self.slack.api_call('chat.postEphemeral', channel=self.channel, user=self.event.get('user'), text=message)
+
+    @staticmethod
+    def delta(operator, operand):
+        '''
+        delta an operator/operand pair adds to a prop value; the regexes only
+        match += and -= with an operand
+        '''
+        return PropsBot.operators[operator](0, operand)
+
+    @staticmethod
+    def apply(name, prop, operator, operand, props=None):
+        '''
+        apply an operation to a props table and return the new value
+        '''
+        props = PropsBot.props if props is None else props
+        if operator:
+            return props.add(name, prop, PropsBot.delta(operator, operand))
+        return props.get(name, prop)
+
+    @staticmethod
+    def apply_batch(deltas, props=None):
+        '''
+        apply a {(name, prop): delta} mapping to a props table in one pass
+        '''
+        props = PropsBot.props if props is None else props
+        for (name, prop), delta in deltas.items():
+            props.add(name, prop, delta)
+
+    @staticmethod
+    def format(name, prop, value):
+        '''
+        format
+        '''
+        return f'{name}:{prop} => {value}'
+
     def update(self, name, prop, operator, operand):
         '''
         update
         '''
         dbg()
-        if operator:
-            member_props = PropsBot.props.pop(name, {})
-            prop_value = member_props.pop(prop, 0)
-            member_props[prop] = PropsBot.operators[operator](prop_value, operand)
-            PropsBot.props[name] = member_props
-        value = PropsBot.props.get(name, {}).get(prop, 0)
-        message = f'{name}:{prop} => {value}'
-        self.send(message)
+        value = PropsBot.apply(name, prop, operator, operand, self.props)
+        self.send(PropsBot.format(name, prop, value))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+replay historical messages through PropsFilter and apply the results in
+batches to a team's tables, the global one and those of props channels;
+reads a Slack export directory (one JSON array per channel per day) or a
+JSONL dump of events, one file at a time so memory stays flat
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from functools import partial
+
+from propsbot import PropsBot, PropsFilter
+from teams import Team, props_path
+from directory import parse_aliases
+from tiered import TieredTable, DEFAULT_HOT_ENTRIES
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_REPORT_EVERY = 5.0
+DEFAULT_STATE_PATH = '/var/lib/props-bot'
+
+def iter_export_files(path, channels=None):
+    '''
+    yield the per-day json files of a Slack export, in channel/date order
+    '''
+    for channel in sorted(os.listdir(path)):
+        channel_path = os.path.join(path, channel)
+        if not os.path.isdir(channel_path):
+            continue
+        if channels and channel not in channels:
+            continue
+        for filename in sorted(os.listdir(channel_path)):
+            if filename.endswith('.json'):
+                yield os.path.join(channel_path, filename)
+
+def load_json(path, filename):
+    '''
+    a json file from an export directory, or None if there is none
+    '''
+    filename = os.path.join(path, filename) if os.path.isdir(path) else None
+    if filename and os.path.isfile(filename):
+        with open(filename) as f:
+            return json.load(f)
+    return None
+
+def iter_export_messages(path, channels=None):
+    '''
+    yield messages from a Slack export; only one day is loaded at a time.
+    export messages carry no channel, so it is set from the directory name,
+    mapped to the channel id through channels.json when it has one
+    '''
+    channel_ids = {channel['name']: channel['id'] for channel in load_json(path, 'channels.json') or ()}
+    for filename in iter_export_files(path, channels):
+        channel = os.path.basename(os.path.dirname(filename))
+        with open(filename) as f:
+            for message in json.load(f):
+                message.setdefault('channel', channel_ids.get(channel, channel))
+                yield message
+
+def iter_jsonl_messages(path):
+    '''
+    yield events from a JSONL dump; event_callback envelopes are unwrapped
+    '''
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                data = json.loads(line)
+                yield data.get('event', data)
+
+def iter_messages(path, channels=None):
+    '''
+    iter_messages
+    '''
+    if os.path.isdir(path):
+        return iter_export_messages(path, channels)
+    return iter_jsonl_messages(path)
+
+def load_members(path, users=None):
+    '''
+    members from the users file, or the export's users.json; None if there
+    are neither
+    '''
+    if users:
+        with open(users) as f:
+            return json.load(f)
+    return load_json(path, 'users.json')
+
+def iter_operations(messages, directory=None):
+    '''
+    parse messages into (channel, name, prop, delta) the way live events
+    are, dropping bot chatter and messages without an operator. with a
+    loaded directory names and mentions resolve to members exactly, as
+    find_member does, and anyone else is dropped; without one names are
+    taken as written and mentions, which cannot be resolved, are dropped
+    '''
+    props_filter = PropsFilter()
+    for message in messages:
+        if message.get('subtype') or message.get('username') == 'props':
+            continue
+        operation = props_filter.operation(message.get('text'))
+        if operation is None:
+            continue
+        name, prop, operator, operand = operation
+        if directory is not None and directory.loaded:
+            member = directory.resolve(name, fuzzy=False)
+            if member is None:
+                continue
+            name = member['name']
+        elif name.startswith('<@'):
+            continue
+        yield message.get('channel'), name, prop, PropsBot.delta(operator, operand)
+
+def iter_batches(operations, batch_size=DEFAULT_BATCH_SIZE):
+    '''
+    fold operations into {(channel, name, prop): delta} batches of
+    batch_size events
+    '''
+    batch, count = {}, 0
+    for channel, name, prop, delta in operations:
+        key = (channel, name, prop)
+        batch[key] = batch.get(key, 0) + delta
+        count += 1
+        if count == batch_size:
+            yield batch, count
+            batch, count = {}, 0
+    if count:
+        yield batch, count
+
+def apply_batch(team, batch):
+    '''
+    apply a {(channel, name, prop): delta} batch to the team's global table
+    and the tables of its props channels, as Team.add does
+    '''
+    totals, channels = {}, {}
+    for (channel, name, prop), delta in batch.items():
+        totals[(name, prop)] = totals.get((name, prop), 0) + delta
+        if team.allows(channel):
+            channels.setdefault(channel, {})[(name, prop)] = delta
+    PropsBot.apply_batch(totals, team.props)
+    for channel, deltas in channels.items():
+        PropsBot.apply_batch(deltas, team.channel_props(channel))
+
+def replay(team, path, channels=None, batch_size=DEFAULT_BATCH_SIZE, report=None, report_every=DEFAULT_REPORT_EVERY):
+    '''
+    replay path into team's tables, resolving names through its directory
+    when that is loaded; returns the number of events applied
+    '''
+    operations = iter_operations(iter_messages(path, channels), team.directory)
+    total, start, last = 0, time.time(), time.time()
+    for batch, count in iter_batches(operations, batch_size):
+        apply_batch(team, batch)
+        total += count
+        now = time.time()
+        if report and now - last >= report_every:
+            report(f'{total} events, {total / (now - start):.0f} events/sec')
+            last = now
+    if report:
+        elapsed = max(time.time() - start, 1e-9)
+        report(f'done: {total} events in {elapsed:.2f}s, {total / elapsed:.0f} events/sec')
+    return total
+
+def main(args=None):
+    '''
+    main
+    '''
+    parser = argparse.ArgumentParser(
+        description='replay a Slack export or JSONL event dump into a team\'s tiered props tables')
+    parser.add_argument('path', help='Slack export directory or JSONL file')
+    parser.add_argument('-t', '--team', required=True, help='SLACK_TEAM_ID of the team to replay into')
+    parser.add_argument('-s', '--state-path', default=DEFAULT_STATE_PATH,
+                        help=f'PROPS_BOT_STATE_PATH holding props.<team>.sqlite (default: {DEFAULT_STATE_PATH})')
+    parser.add_argument('-p', '--props-channel', dest='props_channels',
+                        help='PROPS_BOT_CHANNEL_ID: channel ids whose tables are replayed into too')
+    parser.add_argument('-u', '--users', help='users.json to resolve names with (default: the export\'s)')
+    parser.add_argument('-a', '--aliases', help='PROPS_BOT_ALIASES, as alias=name,...')
+    parser.add_argument('-c', '--channel', dest='channels', action='append', help='only replay these export channels')
+    parser.add_argument('-b', '--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='events per batch')
+    parser.add_argument('--hot-entries', type=int, default=DEFAULT_HOT_ENTRIES, help='PROPS_BOT_HOT_ENTRIES')
+    ns = parser.parse_args(args)
+    store = partial(TieredTable, props_path(ns.state_path, ns.team), hot_entries=ns.hot_entries)
+    team = Team(ns.team, None, None, ns.props_channels, parse_aliases(ns.aliases), store=store)
+    members = load_members(ns.path, ns.users)
+    if members is not None:
+        team.directory.load(members)
+    try:
+        replay(team, ns.path, ns.channels, ns.batch_size, report=lambda msg: print(msg, file=sys.stderr))
+    finally:
+        team.close()
+
+if __name__ == '__main__':
+    main()
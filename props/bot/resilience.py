@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+circuit breakers, jittered retries and deadlines around slack api calls
+'''
+
+import time
+import random
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_BASE = 0.1
+DEFAULT_BACKOFF_CAP = 1.0
+DEFAULT_BUDGET = 2.5 # seconds; slack wants an ack within 3
+DEFAULT_THRESHOLD = 5
+DEFAULT_RESET = 30.0
+
+RETRYABLE_ERRORS = (
+    'ratelimited',
+    'internal_error',
+    'fatal_error',
+    'service_unavailable',
+    'request_timeout',
+)
+
+class RateLimitExceededError(Exception):
+    '''
+    RateLimitExceededError
+    '''
+    def __init__(self, team_id, method):
+        '''
+        init
+        '''
+        msg = f'rate limit exceeded for team {team_id}; method = {method}'
+        super(RateLimitExceededError, self).__init__(msg)
+
+class CircuitOpenError(Exception):
+    '''
+    CircuitOpenError
+    '''
+    def __init__(self, method):
+        '''
+        init
+        '''
+        msg = f'circuit open for {method}'
+        super(CircuitOpenError, self).__init__(msg)
+
+class SlackUnavailableError(Exception):
+    '''
+    SlackUnavailableError
+    '''
+    def __init__(self, method, error):
+        '''
+        init
+        '''
+        msg = f'{method} failed after retries; error = {error}'
+        super(SlackUnavailableError, self).__init__(msg)
+
+class CircuitBreaker:
+    '''
+    closed until threshold consecutive failures, then open for reset seconds,
+    then half open: one trial call closes it again or reopens it
+    '''
+    def __init__(self, threshold=DEFAULT_THRESHOLD, reset=DEFAULT_RESET, clock=time.monotonic):
+        '''
+        init
+        '''
+        self.threshold = threshold
+        self.reset = reset
+        self.clock = clock
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        '''
+        state
+        '''
+        if self.opened is None:
+            return 'closed'
+        if self.clock() - self.opened >= self.reset:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        '''
+        may a call go through?
+        '''
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        '''
+        success
+        '''
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        '''
+        failure
+        '''
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened = self.clock()
+            self.trial = False
+
+class ResilientSlack:
+    '''
+    SlackClient stand-in: a breaker per method, full jitter exponential
+    retries that honour Retry-After, all inside a deadline; budget seconds
+    per call unless the caller passes a deadline shared by several calls
+    '''
+    def __init__(self, slack, retries=DEFAULT_RETRIES, budget=DEFAULT_BUDGET,
+                 threshold=DEFAULT_THRESHOLD, reset=DEFAULT_RESET,
+                 base=DEFAULT_BACKOFF_BASE, cap=DEFAULT_BACKOFF_CAP,
+                 sleep=time.sleep, clock=time.monotonic):
+        '''
+        init
+        '''
+        self.slack = slack
+        self.retries = retries
+        self.budget = budget
+        self.threshold = threshold
+        self.reset = reset
+        self.base = base
+        self.cap = cap
+        self.sleep = sleep
+        self.clock = clock
+        self.breakers = {}
+
+    def breaker(self, method):
+        '''
+        breaker
+        '''
+        breaker = self.breakers.get(method)
+        if breaker is None:
+            breaker = self.breakers.setdefault(method, CircuitBreaker(self.threshold, self.reset, self.clock))
+        return breaker
+
+    @staticmethod
+    def retry_after(result):
+        '''
+        Retry-After seconds from a ratelimited response, if slack sent one
+        '''
+        headers = result.get('headers') or {}
+        value = headers.get('Retry-After') or headers.get('retry-after')
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def api_call(self, method, timeout=None, deadline=None, **kwargs):
+        '''
+        api_call; non retryable slack errors come back as json, as before.
+        deadline is on this client's clock, and caps timeout or the budget
+        '''
+        now = self.clock()
+        limit = now + (timeout or self.budget)
+        deadline = limit if deadline is None else min(deadline, limit)
+        if deadline <= now:
+            raise SlackUnavailableError(method, 'deadline exceeded')
+        breaker = self.breaker(method)
+        if not breaker.allow():
+            raise CircuitOpenError(method)
+        error = None
+        for attempt in range(self.retries + 1):
+            delay = None
+            try:
+                result = self.slack.api_call(method, timeout=max(deadline - self.clock(), 0.1), **kwargs)
+            except Exception as ex: #pylint: disable=broad-except
+                error = ex
+            else:
+                error = result.get('error')
+                if result.get('ok', True) or error not in RETRYABLE_ERRORS:
+                    breaker.success()
+                    return result
+                delay = self.retry_after(result)
+            if attempt == self.retries:
+                break
+            if delay is None:
+                delay = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+            if self.clock() + delay >= deadline:
+                break
+            log.warning(f'{method} failed ({error}); retry {attempt + 1} in {delay:.2f}s')
+            self.sleep(delay)
+        breaker.failure()
+        raise SlackUnavailableError(method, error)
+
+class Deadline:
+    '''
+    SlackClient stand-in that gives every call one shared deadline, budget
+    seconds from now, so all the calls made for one request fit slack's ack
+    window together rather than each on its own
+    '''
+    def __init__(self, slack, budget=DEFAULT_BUDGET, clock=time.monotonic):
+        '''
+        init
+        '''
+        self.slack = slack
+        self.deadline = clock() + budget
+
+    def api_call(self, method, **kwargs):
+        '''
+        api_call
+        '''
+        return self.slack.api_call(method, deadline=self.deadline, **kwargs)
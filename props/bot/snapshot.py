@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+warm start snapshots of the directory, and the digest period in progress:
+a compact line oriented file that is memory mapped and streamed back into a
+Directory on boot
+'''
+
+import os
+import mmap
+import time
+import asyncio
+import logging
+
+from datetime import datetime
+from directory import PrefixIndex
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 300
+MAGIC = b'props-directory'
+VERSION = 1
+SEP = '\t'
+ROLLED_FORMAT = '%Y-%m-%dT%H:%M'
+
+class SnapshotFormatError(Exception):
+    '''
+    SnapshotFormatError
+    '''
+    def __init__(self, path, header):
+        '''
+        init
+        '''
+        msg = f'{path} is not a version {VERSION} directory snapshot; header = {header}'
+        super(SnapshotFormatError, self).__init__(msg)
+
+def clean(value):
+    '''
+    field text with the separators blanked out; None becomes empty
+    '''
+    return (value or '').replace(SEP, ' ').replace('\n', ' ')
+
+def lines(directory, digest=None):
+    '''
+    the snapshot of directory (and digest, unless it is shared and keeps
+    itself) as a list of lines; built on the loop thread so it sees one
+    consistent state, written out elsewhere
+    '''
+    header = f'{MAGIC.decode()} {VERSION} {directory.loaded or time.time()}\n'
+    result = [header]
+    for member in directory.members.values():
+        profile = member.get('profile') or {}
+        result.append(SEP.join((
+            'M',
+            member['id'],
+            clean(member['name']),
+            clean(profile.get('display_name')),
+            clean(profile.get('display_name_normalized')))) + '\n')
+    for _, prop in directory.props.keys:
+        result.append(f'P{SEP}{clean(prop)}\n')
+    for channel, member_ids in directory.channels.items():
+        result.append(f'C{SEP}{channel}{SEP}{",".join(member_ids)}\n')
+    if digest is not None and not digest.shared:
+        if digest.rolled is not None:
+            result.append(f'R{SEP}{digest.rolled:{ROLLED_FORMAT}}\n')
+        for (name, prop), total in digest.totals.items():
+            result.append(f'D{SEP}{clean(name)}{SEP}{clean(prop)}{SEP}{total}\n')
+    return result
+
+def write(path, lines):
+    '''
+    write lines to path atomically, so a crash mid-write keeps the old file
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(tmp, path)
+
+def save(directory, path, digest=None):
+    '''
+    save
+    '''
+    write(path, lines(directory, digest))
+
+def records(path):
+    '''
+    yield (kind, fields) from a memory mapped snapshot, a line at a time
+    '''
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header = mm.readline().split()
+            if len(header) != 3 or header[0] != MAGIC or header[1] != str(VERSION).encode():
+                raise SnapshotFormatError(path, header)
+            yield 'H', [float(header[2])]
+            for line in iter(mm.readline, b''):
+                fields = line.decode('utf-8').rstrip('\n').split(SEP)
+                yield fields[0], fields[1:]
+
+def member(fields):
+    '''
+    member
+    '''
+    member_id, name, display_name, display_name_normalized = fields
+    return dict(
+        id=member_id,
+        name=name,
+        deleted=False,
+        profile=dict(
+            display_name=display_name or None,
+            display_name_normalized=display_name_normalized or None))
+
+def restore(directory, path, digest=None):
+    '''
+    load a snapshot into directory, and digest if given and not shared;
+    returns False when
+    there is none. loaded is set to when the snapshot was taken, so it reads
+    as stale and the first refresh reconciles it against slack
+    '''
+    try:
+        saved, members, props, channels, totals, rolled = 0, [], [], {}, {}, None
+        for kind, fields in records(path):
+            if kind == 'M':
+                members.append(member(fields))
+            elif kind == 'P':
+                props.extend(fields)
+            elif kind == 'C':
+                channels[fields[0]] = set(filter(None, fields[1].split(',')))
+            elif kind == 'H':
+                saved = fields[0]
+            elif kind == 'D':
+                totals[(fields[0], fields[1] or None)] = int(fields[2])
+            elif kind == 'R':
+                rolled = datetime.strptime(fields[0], ROLLED_FORMAT)
+    except FileNotFoundError:
+        return False
+    except (ValueError, SnapshotFormatError) as ex:
+        log.warning(f'ignoring directory snapshot {path}: {ex}')
+        return False
+    directory.load(members)
+    directory.props = PrefixIndex((prop, prop) for prop in props)
+    directory.channels.update(channels)
+    directory.loaded = saved
+    if digest is not None and not digest.shared:
+        digest.totals.update(totals)
+        digest.rolled = rolled
+    return True
+
+async def keep_saved(directory, path, interval=DEFAULT_INTERVAL, digest=None):
+    '''
+    save directory (and digest) every interval seconds, once it has loaded;
+    the file is written in an executor
+    '''
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(interval)
+        if not directory.loaded:
+            continue
+        try:
+            await loop.run_in_executor(None, write, path, lines(directory, digest))
+        except OSError as ex:
+            log.error(f'directory snapshot to {path} failed: {ex}')
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+socket mode: receive events over a persistent websocket instead of webhooks
+'''
+
+import json
+import random
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 60.0
+
+class ConnectionsOpenError(Exception):
+    '''
+    ConnectionsOpenError
+    '''
+    def __init__(self, json):
+        '''
+        init
+        '''
+        msg = f'apps.connections.open error; json = {json}'
+        super(ConnectionsOpenError, self).__init__(msg)
+
+class SocketModeClient:
+    '''
+    holds a websocket to slack, acks every envelope as soon as it arrives and
+    hands events_api payloads to handler; slash_commands and interactive
+    envelopes go to the matching responder, whose result rides on the ack.
+    reconnects with jittered backoff
+    '''
+    def __init__(self, app_token, handler, responders=None, url=None, connect=None,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX):
+        '''
+        init; responders maps an envelope type to an async callable that
+        returns the response body for its payload, or None
+        '''
+        self.app_token = app_token
+        self.handler = handler
+        self.responders = responders or {}
+        self.url = url
+        self.connect = connect
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.attempts = 0
+        self.running = False
+
+    def backoff(self):
+        '''
+        full jitter exponential backoff for the current attempt
+        '''
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** self.attempts))
+
+    def connections_open(self):
+        '''
+        ask slack for a fresh websocket url
+        '''
+        from slackclient import SlackClient
+        result = SlackClient(self.app_token).api_call('apps.connections.open')
+        if result.get('ok'):
+            return result['url']
+        raise ConnectionsOpenError(result)
+
+    async def connection_url(self):
+        '''
+        connection_url
+        '''
+        if self.url:
+            return self.url
+        return await asyncio.get_event_loop().run_in_executor(None, self.connections_open)
+
+    async def dispatch(self, ws, raw):
+        '''
+        ack an envelope, then schedule its payload; returns False on disconnect
+        '''
+        message = json.loads(raw)
+        if message.get('type') == 'disconnect':
+            return False
+        kind = message.get('type')
+        ack = dict(envelope_id=message.get('envelope_id'))
+        if kind in self.responders:
+            response = await self.respond(kind, message.get('payload'))
+            if response:
+                ack.update(payload=response)
+        elif kind in ('slash_commands', 'interactive'):
+            log.warning(f'socket mode has no responder for {kind}; rejecting it')
+        if ack['envelope_id']:
+            await ws.send(json.dumps(ack))
+        if kind == 'events_api':
+            asyncio.ensure_future(self.handle(message['payload']))
+        return True
+
+    async def respond(self, kind, payload):
+        '''
+        the responder's body for payload; None if it raised, which still acks
+        '''
+        try:
+            return await self.responders[kind](payload)
+        except Exception as ex: #pylint: disable=broad-except
+            log.exception(f'socket mode {kind} responder raised {ex}')
+            return None
+
+    async def handle(self, payload):
+        '''
+        handle
+        '''
+        try:
+            await self.handler(payload)
+        except Exception as ex: #pylint: disable=broad-except
+            log.exception(f'socket mode handler raised {ex}')
+
+    async def session(self):
+        '''
+        one websocket session; returns when slack asks us to reconnect
+        '''
+        connect = self.connect
+        if connect is None:
+            import websockets
+            connect = websockets.connect
+        url = await self.connection_url()
+        async with connect(url) as ws:
+            self.attempts = 0
+            async for raw in ws:
+                if not await self.dispatch(ws, raw):
+                    return
+
+    async def run(self):
+        '''
+        run until stop() is called
+        '''
+        self.running = True
+        while self.running:
+            try:
+                await self.session()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex: #pylint: disable=broad-except
+                delay = self.backoff()
+                self.attempts += 1
+                log.warning(f'socket mode connection failed ({ex}); reconnecting in {delay:.1f}s')
+                await asyncio.sleep(delay)
+
+    def stop(self):
+        '''
+        stop
+        '''
+        self.running = False
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+compact props counter table
+'''
+
+import time
+import heapq
+
+from array import array
+
+class PropsTable:
+    '''
+    user and prop names are interned to integer ids; each (user, prop) cell
+    is a row in array-backed columns, and updates happen in place. a user's
+    rows are chained through the next column, newest first; that chain is
+    both how a cell is found, in as many steps as the user has props, and
+    how a user's cells are listed without scanning the table
+    '''
+    def __init__(self):
+        '''
+        init
+        '''
+        self.user_ids = {}
+        self.user_names = []
+        self.prop_ids = {}
+        self.prop_names = []
+        self.users = array('i')
+        self.props = array('i')
+        self.values = array('q')
+        self.updated = array('I')
+        self.next = array('i')
+        self.heads = array('i')
+
+    def __len__(self):
+        '''
+        number of (user, prop) cells
+        '''
+        return len(self.values)
+
+    def __contains__(self, name):
+        '''
+        contains
+        '''
+        return name in self.user_ids
+
+    @staticmethod
+    def _intern(key, ids, names):
+        '''
+        _intern
+        '''
+        i = ids.get(key)
+        if i is None:
+            i = len(names)
+            ids[key] = i
+            names.append(key)
+        return i
+
+    def _row(self, name, prop, create=False):
+        '''
+        row index for (name, prop), optionally creating the cell
+        '''
+        uid, pid = self.user_ids.get(name), self.prop_ids.get(prop)
+        if uid is not None and pid is not None:
+            props, chain = self.props, self.next
+            row = self.heads[uid]
+            while row != -1:
+                if props[row] == pid:
+                    return row
+                row = chain[row]
+        if not create:
+            return None
+        uid = self._intern(name, self.user_ids, self.user_names)
+        pid = self._intern(prop, self.prop_ids, self.prop_names)
+        row = len(self.values)
+        self.users.append(uid)
+        self.props.append(pid)
+        self.values.append(0)
+        self.updated.append(0)
+        if uid == len(self.heads):
+            self.heads.append(-1)
+        self.next.append(self.heads[uid])
+        self.heads[uid] = row
+        return row
+
+    def get(self, name, prop, default=0):
+        '''
+        get
+        '''
+        row = self._row(name, prop)
+        return default if row is None else self.values[row]
+
+    def add(self, name, prop, delta, when=None):
+        '''
+        add delta to (name, prop) in place and return the new value
+        '''
+        row = self._row(name, prop, create=True)
+        self.values[row] += delta
+        self.updated[row] = int(when or time.time())
+        return self.values[row]
+
+    def user_props(self, name):
+        '''
+        {prop: value} for one user
+        '''
+        uid = self.user_ids.get(name)
+        if uid is None:
+            return {}
+        result = {}
+        row = self.heads[uid]
+        while row != -1:
+            result[self.prop_names[self.props[row]]] = self.values[row]
+            row = self.next[row]
+        return result
+
+    def items(self):
+        '''
+        yield (name, prop, value) for every cell
+        '''
+        for row in range(len(self.values)):
+            yield self.user_names[self.users[row]], self.prop_names[self.props[row]], self.values[row]
+
+    def rows(self, name=None, prop=None, since=None, until=None):
+        '''
+        yield (name, prop, value, updated) for the cells matching the filters;
+        a name filter walks that user's chain instead of the whole table
+        '''
+        if name is not None:
+            uid = self.user_ids.get(name)
+            row = self.heads[uid] if uid is not None else -1
+            rows = []
+            while row != -1:
+                rows.append(row)
+                row = self.next[row]
+            rows.reverse()
+        else:
+            rows = range(len(self.values))
+        pid = self.prop_ids.get(prop, -1) if prop is not None else None
+        for row in rows:
+            if pid is not None and self.props[row] != pid:
+                continue
+            updated = self.updated[row]
+            if (since is not None and updated < since) or (until is not None and updated >= until):
+                continue
+            yield self.user_names[self.users[row]], self.prop_names[self.props[row]], self.values[row], updated
+
+    def candidates(self, count, prop=None):
+        '''
+        (name, prop, value) cells that could make the count largest: all of
+        them, optionally of one prop
+        '''
+        return self.items() if prop is None else (cell for cell in self.items() if cell[1] == prop)
+
+    def top(self, count=10, prop=None):
+        '''
+        the count largest (name, prop, value) cells, optionally of one prop
+        '''
+        return heapq.nlargest(count, self.candidates(count, prop), key=lambda cell: cell[2])
+
+    def as_dict(self):
+        '''
+        {name: {prop: value}}
+        '''
+        result = {}
+        for name, prop, value in self.items():
+            result.setdefault(name, {})[prop] = value
+        return result
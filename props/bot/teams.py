@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+per-workspace partitions: each team gets its own props tables, member
+directory, slack client and rate limiter
+'''
+
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+
+from table import PropsTable
+from tiered import TieredTable
+from digest import Digest, SharedDigest
+from directory import Directory, parse_aliases
+from resilience import ResilientSlack, Deadline, RateLimitExceededError, DEFAULT_BUDGET
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 20
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_TOP = 10
+
+channels_regex = re.compile(r'[\s,|]+')
+
+class TeamsConfigError(Exception):
+    '''
+    TeamsConfigError
+    '''
+    def __init__(self, entry):
+        '''
+        init
+        '''
+        msg = ('SLACK_TEAMS entry must be team_id:bot_token:verification_token[:channel_id|channel_id...]; '
+               f'entry = {entry}')
+        super(TeamsConfigError, self).__init__(msg)
+
+class RateLimiter:
+    '''
+    token bucket: rate tokens per second, up to burst
+    '''
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        '''
+        init
+        '''
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def configure(self, rate, burst):
+        '''
+        change the rate and burst, keeping the tokens already earned up to
+        the new burst
+        '''
+        with self.lock:
+            self.rate = rate
+            self.burst = burst
+            self.tokens = min(self.tokens, float(burst))
+
+    def acquire(self, wait=False):
+        '''
+        take a token if one is available; with wait, sleep until one is
+        '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                if not wait or self.rate <= 0:
+                    return False
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+class RateLimitedSlack:
+    '''
+    SlackClient stand-in that spends a team token before every api_call;
+    with wait it blocks until one is available instead of raising
+    '''
+    def __init__(self, slack, limiter, team_id, wait=False):
+        '''
+        init
+        '''
+        self.slack = slack
+        self.limiter = limiter
+        self.team_id = team_id
+        self.wait = wait
+
+    def api_call(self, method, **kwargs):
+        '''
+        api_call
+        '''
+        if not self.limiter.acquire(self.wait):
+            raise RateLimitExceededError(self.team_id, method)
+        return self.slack.api_call(method, **kwargs)
+
+def props_path(state_path, team_id):
+    '''
+    the sqlite file behind a team's tiered props tables
+    '''
+    return os.path.join(state_path, f'props.{team_id}.sqlite')
+
+def digest_path(state_path, team_id):
+    '''
+    the sqlite file behind a team's SharedDigest
+    '''
+    return os.path.join(state_path, f'digest.{team_id}.sqlite')
+
+class TieredStore:
+    '''
+    store(scope) for TieredTables in path: the global table holds up to
+    hot_entries hot cells and the channel tables split as many between them,
+    so a team never keeps more than twice hot_entries resident
+    '''
+    def __init__(self, path, hot_entries, channels):
+        '''
+        init
+        '''
+        self.path = path
+        self.hot_entries = hot_entries
+        self.share = max(1, hot_entries // max(1, len(channels)))
+
+    def cap(self, scope):
+        '''
+        the hot cap for the table of scope
+        '''
+        return self.hot_entries if scope == '' else self.share
+
+    def __call__(self, scope):
+        '''
+        call
+        '''
+        return TieredTable(self.path, scope, self.cap(scope))
+
+def parse_channels(channels):
+    '''
+    channel ids separated by commas, pipes or whitespace, in order
+    '''
+    return tuple(channel for channel in channels_regex.split(channels or '') if channel)
+
+class Team:
+    '''
+    Team; props holds the global tallies and channel_tables one partition
+    per channel, so channel leaderboards never scan global data
+    '''
+    def __init__(self, team_id, token, verification_token, channel_id=None, aliases=None,
+                 rate=DEFAULT_RATE, burst=DEFAULT_BURST, resilience=None, store=None, digest=None):
+        '''
+        init; channel_id may list several channels, the first one gets digests.
+        store(scope) makes the table behind the global ('') and each channel's
+        tallies; in memory PropsTables by default, and an in memory Digest
+        unless digest is given
+        '''
+        self.team_id = team_id
+        self.token = token
+        self.verification_token = verification_token
+        self.set_channels(channel_id)
+        self.store = store or (lambda scope: PropsTable())
+        self.props = self.store('')
+        self.channel_tables = {}
+        self.digest = digest or Digest()
+        self.limiter = RateLimiter(rate, burst)
+        self.directory_limiter = RateLimiter(rate, burst)
+        self.resilience = resilience or {}
+        self.directory = Directory(aliases=aliases, client=lambda: self.directory_slack, lookup=lambda: self.slack)
+        self._slack = None
+        self._directory_slack = None
+
+    @property
+    def slack(self):
+        '''
+        one rate limited, resilient client per team, rebuilt when the token
+        changes; the breakers live as long as the client
+        '''
+        if self._slack is None:
+            from slackclient import SlackClient
+            slack = ResilientSlack(SlackClient(self.token), **self.resilience)
+            self._slack = RateLimitedSlack(slack, self.limiter, self.team_id)
+        return self._slack
+
+    @property
+    def directory_slack(self):
+        '''
+        the client background directory paging uses: the same breakers, but
+        its own bucket, and it waits for tokens instead of failing, so a
+        large workspace still loads and never drains user facing calls
+        '''
+        slack = self.slack
+        if self._directory_slack is None or self._directory_slack.slack is not slack.slack:
+            self._directory_slack = RateLimitedSlack(slack.slack, self.directory_limiter, self.team_id, wait=True)
+        return self._directory_slack
+
+    def request_slack(self):
+        '''
+        the team client for one request: every call made through it shares
+        a single call budget, so the calls together still fit slack's ack
+        '''
+        return Deadline(self.slack, self.resilience.get('budget', DEFAULT_BUDGET))
+
+    def configure(self, token, verification_token, channel_id=None, aliases=None,
+                  rate=None, burst=None, resilience=None, store=None):
+        '''
+        apply reloaded settings without dropping props or caches: tokens,
+        channels, and aliases, rate limits and resilience unless None, take
+        effect at once, and a TieredStore's hot caps resize the tables.
+        moving between the in memory and tiered stores, or the tiered store
+        to another path, needs a restart
+        '''
+        rebuild = token != self.token or (resilience is not None and resilience != self.resilience)
+        self.token = token
+        self.verification_token = verification_token
+        self.set_channels(channel_id)
+        if aliases is not None:
+            self.directory.set_aliases(aliases)
+        if rate is not None and burst is not None:
+            self.limiter.configure(rate, burst)
+            self.directory_limiter.configure(rate, burst)
+        if resilience is not None:
+            self.resilience = resilience
+        if rebuild:
+            self._slack = None
+        if getattr(self.store, 'path', None) != getattr(store, 'path', None):
+            log.warning(f'props storage for {self.team_id} changes at the next restart')
+        elif store is not None:
+            self.store = store
+            self.props.resize(store.cap(''))
+            for channel, props in self.channel_tables.items():
+                props.resize(store.cap(channel))
+
+    def set_channels(self, channel_id):
+        '''
+        set_channels
+        '''
+        channels = parse_channels(channel_id)
+        self.channel_id = channels[0] if channels else None
+        self.channels = frozenset(channels)
+
+    def allows(self, channel):
+        '''
+        are props enabled in channel?
+        '''
+        return channel in self.channels
+
+    def channel_props(self, channel):
+        '''
+        the props partition for channel, created on first use
+        '''
+        props = self.channel_tables.get(channel)
+        if props is None:
+            props = self.channel_tables.setdefault(channel, self.store(channel))
+        return props
+
+    def add(self, channel, name, prop, delta):
+        '''
+        add delta to the global tally and, for props channels, the channel
+        one; returns the new global and channel values
+        '''
+        self.digest.record(name, prop, delta)
+        local = self.channel_props(channel).add(name, prop, delta) if self.allows(channel) else None
+        return self.props.add(name, prop, delta), local
+
+    def leaderboard(self, channel=None, count=DEFAULT_TOP, prop=None):
+        '''
+        top (name, prop, value) cells, globally or for one channel
+        '''
+        props = self.scope_props(channel)
+        return [] if props is None else props.top(count, prop)
+
+    def scope_props(self, channel=None):
+        '''
+        the global table, or channel's when props are enabled there; None
+        for any other channel
+        '''
+        if channel is None:
+            return self.props
+        return self.channel_props(channel) if self.allows(channel) else None
+
+    def flush(self):
+        '''
+        write what tables backed by storage hold back; the number of rows
+        '''
+        tables = [self.props] + list(self.channel_tables.values())
+        return sum(props.flush() for props in tables if hasattr(props, 'flush'))
+
+    def close(self):
+        '''
+        let tables backed by storage spill what they hold
+        '''
+        for props in [self.props] + list(self.channel_tables.values()):
+            close = getattr(props, 'close', None)
+            if close:
+                close()
+
+    async def keep_flushed(self, interval=DEFAULT_FLUSH_INTERVAL):
+        '''
+        flush every interval seconds
+        '''
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.flush()
+            except Exception as ex: #pylint: disable=broad-except
+                log.error(f'props flush for {self.team_id} raised {ex}')
+
+class Teams:
+    '''
+    Teams
+    '''
+    def __init__(self):
+        '''
+        init
+        '''
+        self.teams = {}
+        self.listeners = []
+
+    def __iter__(self):
+        '''
+        iter
+        '''
+        return iter(self.teams.values())
+
+    def get(self, team_id):
+        '''
+        get
+        '''
+        return self.teams.get(team_id)
+
+    def subscribe(self, listener):
+        '''
+        call listener(team) for every team now and for each one added later
+        '''
+        self.listeners.append(listener)
+        for team in list(self):
+            self.notify(listener, team)
+
+    @staticmethod
+    def notify(listener, team):
+        '''
+        notify
+        '''
+        try:
+            listener(team)
+        except Exception as ex: #pylint: disable=broad-except
+            log.error(f'teams listener {listener} failed for {team.team_id}: {ex}')
+
+    def is_request_valid(self, token, team_id):
+        '''
+        is_request_valid
+        '''
+        team = self.teams.get(team_id)
+        return team is not None and token == team.verification_token
+
+    @staticmethod
+    def entries(settings):
+        '''
+        (team_id, token, verification_token, channel_id) for every configured team
+        '''
+        yield (
+            settings.SLACK_TEAM_ID,
+            settings.BOT_USER_OAUTH_ACCESS_TOKEN,
+            settings.SLACK_VERIFICATION_TOKEN,
+            settings.PROPS_BOT_CHANNEL_ID)
+        for entry in filter(None, settings.SLACK_TEAMS.split(',')):
+            parts = entry.strip().split(':')
+            if len(parts) not in (3, 4):
+                raise TeamsConfigError(entry)
+            yield tuple(parts) + (None, ) * (4 - len(parts))
+
+    def configure(self, settings):
+        '''
+        add new teams and apply a settings snapshot to existing ones; teams
+        that disappear keep serving, and APP_WORKERS and PROPS_BOT_STATE_PATH
+        changes wait, until restart
+        '''
+        aliases = parse_aliases(settings.PROPS_BOT_ALIASES)
+        for team_id, token, verification_token, channel_id in self.entries(settings):
+            store = None
+            if settings.PROPS_BOT_HOT_ENTRIES:
+                path = props_path(settings.PROPS_BOT_STATE_PATH, team_id)
+                store = TieredStore(path, settings.PROPS_BOT_HOT_ENTRIES, parse_channels(channel_id))
+            resilience = dict(
+                retries=settings.SLACK_RETRIES,
+                budget=settings.SLACK_CALL_BUDGET_MS / 1000.0,
+                threshold=settings.SLACK_BREAKER_THRESHOLD,
+                reset=settings.SLACK_BREAKER_RESET)
+            team = self.teams.get(team_id)
+            if team:
+                team.configure(
+                    token,
+                    verification_token,
+                    channel_id,
+                    aliases,
+                    settings.SLACK_RATE_LIMIT,
+                    settings.SLACK_RATE_BURST,
+                    resilience,
+                    store)
+            else:
+                digest = None
+                if settings.APP_WORKERS > 1:
+                    digest = SharedDigest(digest_path(settings.PROPS_BOT_STATE_PATH, team_id))
+                team = self.teams[team_id] = Team(
+                    team_id,
+                    token,
+                    verification_token,
+                    channel_id,
+                    aliases,
+                    settings.SLACK_RATE_LIMIT,
+                    settings.SLACK_RATE_BURST,
+                    resilience,
+                    store,
+                    digest)
+                for listener in self.listeners:
+                    self.notify(listener, team)
+        return self
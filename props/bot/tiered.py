@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+tiered props storage: recently used (user, prop) cells in an in-memory lru,
+the rest in sqlite, faulted back in when they are touched again
+'''
+
+import os
+import time
+import heapq
+
+from itertools import chain
+from collections import OrderedDict
+
+DEFAULT_HOT_ENTRIES = 100000
+EVICT_FRACTION = 0.1 # evict this much of the cap at once
+PAGE_SIZE = 1000
+FLUSH_ENTRIES = 1000 # cold tier writes held back and coalesced before one transaction
+NO_PROP = '' # the parser never yields an empty prop, so it can stand in for None
+
+SCHEMA = '''
+create table if not exists props (
+    scope text not null,
+    name text not null,
+    prop text not null,
+    value integer not null,
+    updated integer not null,
+    primary key (scope, name, prop)
+) without rowid;
+create index if not exists props_value on props (scope, value);
+'''
+
+CONNECTIONS = {}
+
+def connect(path):
+    '''
+    the cold tier connection for path; one per file, shared by the global and
+    channel tables stored in it, and used from the loop thread only
+    '''
+    connection = CONNECTIONS.get(path)
+    if connection is None:
+        import sqlite3
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        connection = sqlite3.connect(path, isolation_level=None)
+        connection.execute('pragma journal_mode=wal')
+        connection.execute('pragma synchronous=normal')
+        connection.executescript(SCHEMA)
+        CONNECTIONS[path] = connection
+    return connection
+
+def encode(prop):
+    '''
+    encode
+    '''
+    return NO_PROP if prop is None else prop
+
+def decode(prop):
+    '''
+    decode
+    '''
+    return None if prop == NO_PROP else prop
+
+class TieredTable:
+    '''
+    PropsTable stand-in with at most hot_entries cells resident. a hot cell
+    is the live one; a cell faulted in keeps a stale cold copy (shadowed)
+    until the next flush deletes it or eviction overwrites it, so reads of
+    the cold tier skip hot keys.
+
+    cold tier writes are coalesced: evicted cells wait in spilled, and a
+    flush writes them and deletes the shadowed copies in one transaction
+    once flush_entries are pending, on close, or when asked. a cell touched
+    again before then comes back from spilled without touching sqlite, so
+    one that churns in and out of the lru costs one write per flush, not
+    one per eviction. while a rows() generator is live the cold tier is
+    frozen: no evictions and no flushes, so it reads as of the moment
+    rows() started
+    '''
+    def __init__(self, path, scope='', hot_entries=DEFAULT_HOT_ENTRIES, flush_entries=FLUSH_ENTRIES):
+        '''
+        init; the sqlite file at path is opened on first use
+        '''
+        self.path = path
+        self.scope = scope
+        self.hot_entries = hot_entries
+        self.flush_entries = flush_entries
+        self.hot = OrderedDict() # (name, prop) -> [value, updated]
+        self.users = {} # name -> set of hot props
+        self.shadowed = set() # hot keys with a stale cold copy
+        self.spilled = {} # (name, prop) -> (value, updated, shadowed), evicted but not yet written
+        self.readers = 0
+        self.faults = 0
+        self.evictions = 0
+        self.writes = 0
+
+    @property
+    def connection(self):
+        '''
+        connection
+        '''
+        return connect(self.path)
+
+    def __len__(self):
+        '''
+        number of (user, prop) cells across both tiers
+        '''
+        self.flush()
+        cold, = self.connection.execute('select count(*) from props where scope = ?', (self.scope, )).fetchone()
+        return len(self.hot) + cold - len(self.shadowed)
+
+    def __contains__(self, name):
+        '''
+        contains
+        '''
+        if name in self.users or any(key[0] == name for key in self.spilled):
+            return True
+        return self.connection.execute(
+            'select 1 from props where scope = ? and name = ? limit 1', (self.scope, name)).fetchone() is not None
+
+    def _fault(self, name, prop):
+        '''
+        copy a cell from the cold tier into the hot one; None if it has none.
+        a cell still waiting in spilled comes back as is; a cold copy is left
+        shadowed and deleted by the next flush
+        '''
+        spilled = self.spilled.pop((name, prop), None)
+        if spilled is not None:
+            value, updated, shadowed = spilled
+            if shadowed:
+                self.shadowed.add((name, prop))
+            return self._insert(name, prop, [value, updated])
+        row = self.connection.execute(
+            'select value, updated from props where scope = ? and name = ? and prop = ?',
+            (self.scope, name, encode(prop))).fetchone()
+        if row is None:
+            return None
+        self.faults += 1
+        self.shadowed.add((name, prop))
+        cell = self._insert(name, prop, list(row))
+        if len(self.shadowed) >= self.flush_entries:
+            self.flush()
+        return cell
+
+    def _insert(self, name, prop, cell):
+        '''
+        _insert
+        '''
+        self.hot[(name, prop)] = cell
+        self.users.setdefault(name, set()).add(prop)
+        if len(self.hot) > self.hot_entries and not self.readers:
+            self.evict(max(1, int(self.hot_entries * EVICT_FRACTION)))
+        return cell
+
+    def flush(self):
+        '''
+        write the spilled cells and delete the stale cold copies of hot ones
+        in one transaction; not while rows() is reading the cold tier
+        '''
+        if self.readers:
+            return 0
+        return self._write()
+
+    def _write(self):
+        '''
+        _write
+        '''
+        if not (self.spilled or self.shadowed):
+            return 0
+        keys = [(self.scope, name, encode(prop)) for name, prop in self.shadowed]
+        cells = [(self.scope, name, encode(prop), value, updated)
+                 for (name, prop), (value, updated, _) in self.spilled.items()]
+        with self.connection:
+            self.connection.execute('begin')
+            self.connection.executemany('delete from props where scope = ? and name = ? and prop = ?', keys)
+            self.connection.executemany('insert or replace into props values (?, ?, ?, ?, ?)', cells)
+        self.shadowed.clear()
+        self.spilled.clear()
+        self.writes += len(keys) + len(cells)
+        return len(keys) + len(cells)
+
+    def _cell(self, name, prop):
+        '''
+        the hot cell for (name, prop), faulting it in if it is cold
+        '''
+        cell = self.hot.get((name, prop))
+        if cell is not None:
+            self.hot.move_to_end((name, prop))
+            return cell
+        return self._fault(name, prop)
+
+    def evict(self, count):
+        '''
+        move the count least recently used cells to spilled, to be written
+        over their shadowed copies by a flush
+        '''
+        count = min(count, len(self.hot))
+        for _ in range(count):
+            (name, prop), (value, updated) = self.hot.popitem(last=False)
+            props = self.users[name]
+            props.discard(prop)
+            if not props:
+                del self.users[name]
+            shadowed = (name, prop) in self.shadowed
+            self.shadowed.discard((name, prop))
+            self.spilled[(name, prop)] = (value, updated, shadowed)
+        self.evictions += count
+        if len(self.spilled) >= self.flush_entries:
+            self.flush()
+        return count
+
+    def close(self):
+        '''
+        spill every hot cell and write it so the cold tier holds the full
+        table, live rows() generators or not
+        '''
+        self.evict(len(self.hot))
+        self._write()
+
+    def resize(self, hot_entries):
+        '''
+        change the hot cap; shrinking evicts down to it, unless rows() is
+        reading, in which case the overflow goes when it is done
+        '''
+        self.hot_entries = hot_entries
+        if len(self.hot) > hot_entries and not self.readers:
+            self.evict(len(self.hot) - hot_entries)
+
+    def get(self, name, prop, default=0):
+        '''
+        get
+        '''
+        cell = self._cell(name, prop)
+        return default if cell is None else cell[0]
+
+    def add(self, name, prop, delta, when=None):
+        '''
+        add delta to (name, prop) and return the new value
+        '''
+        cell = self._cell(name, prop) or self._insert(name, prop, [0, 0])
+        cell[0] += delta
+        cell[1] = int(when or time.time())
+        return cell[0]
+
+    def user_props(self, name):
+        '''
+        {prop: value} for one user, from both tiers without faulting
+        '''
+        result = {decode(prop): value for prop, value in self.connection.execute(
+            'select prop, value from props where scope = ? and name = ?', (self.scope, name))}
+        for (spilled_name, prop), (value, _, _) in self.spilled.items():
+            if spilled_name == name:
+                result[prop] = value
+        for prop in self.users.get(name, ()):
+            result[prop] = self.hot[(name, prop)][0]
+        return result
+
+    def cold_rows(self, name=None, prop=None, since=None, until=None):
+        '''
+        yield cold (name, prop, value, updated) rows a page at a time, keyed
+        on the primary key so evictions in between pages are harmless
+        '''
+        where, params = ['scope = ?'], [self.scope]
+        for clause, value in (('name = ?', name), ('prop = ?', None if prop is None else encode(prop)),
+                              ('updated >= ?', since), ('updated < ?', until)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        sql = (f'select name, prop, value, updated from props where {" and ".join(where)} '
+               f'and (name > ? or (name = ? and prop > ?)) order by name, prop limit {PAGE_SIZE}')
+        last = ('', '')
+        while True:
+            page = self.connection.execute(sql, params + [last[0], last[0], last[1]]).fetchall()
+            for row_name, row_prop, value, updated in page:
+                yield row_name, decode(row_prop), value, updated
+            if len(page) < PAGE_SIZE:
+                return
+            last = page[-1][:2]
+
+    def rows(self, name=None, prop=None, since=None, until=None):
+        '''
+        yield (name, prop, value, updated) for the cells matching the filters
+        as they were when iteration started, hot ones first; adds in between
+        never make a cell show up twice or not at all
+        '''
+        self.flush()
+        if name is not None:
+            keys = [(name, hot_prop) for hot_prop in self.users.get(name, ())]
+        else:
+            keys = list(self.hot)
+        hot = [key + tuple(self.hot[key]) for key in keys]
+        self.readers += 1
+        try:
+            for cell_name, cell_prop, value, updated in hot:
+                if prop is not None and cell_prop != prop:
+                    continue
+                if (since is not None and updated < since) or (until is not None and updated >= until):
+                    continue
+                yield cell_name, cell_prop, value, updated
+            keys = set(keys)
+            for row in self.cold_rows(name, prop, since, until):
+                if row[:2] not in keys:
+                    yield row
+        finally:
+            self.readers -= 1
+            if not self.readers:
+                self.flush()
+                if len(self.hot) > self.hot_entries:
+                    self.evict(len(self.hot) - self.hot_entries)
+
+    def items(self):
+        '''
+        yield (name, prop, value) for every cell
+        '''
+        for name, prop, value, _ in self.rows():
+            yield name, prop, value
+
+    def candidates(self, count, prop=None):
+        '''
+        (name, prop, value) cells that could make the count largest: every
+        hot and spilled one, and the cold tier's count largest from its value
+        index; a snapshot, so it stays valid while the table changes
+        '''
+        sql = 'select name, prop, value from props where scope = ?'
+        params = [self.scope]
+        if prop is not None:
+            sql += ' and prop = ?'
+            params.append(encode(prop))
+        sql += ' order by value desc limit ?'
+        rows = self.connection.execute(sql, params + [count + len(self.shadowed) + len(self.spilled)])
+        cold = [(name, decode(cold_prop), value) for name, cold_prop, value in rows
+                if (name, decode(cold_prop)) not in self.hot and (name, decode(cold_prop)) not in self.spilled]
+        hot = [(name, hot_prop, cell[0]) for (name, hot_prop), cell in self.hot.items()
+               if prop is None or hot_prop == prop]
+        spilled = [(name, spilled_prop, cell[0]) for (name, spilled_prop), cell in self.spilled.items()
+                   if prop is None or spilled_prop == prop]
+        return chain(hot, spilled, cold)
+
+    def top(self, count=10, prop=None):
+        '''
+        the count largest (name, prop, value) cells
+        '''
+        return heapq.nlargest(count, self.candidates(count, prop), key=lambda cell: cell[2])
+
+    def as_dict(self):
+        '''
+        {name: {prop: value}}
+        '''
+        result = {}
+        for name, prop, value in self.items():
+            result.setdefault(name, {})[prop] = value
+        return result
@@ -1,10 +1,43 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from props.bot.propsbot import PropsBot
+import time
+
+from props.bot.propsbot import PropsBot, PropsFilter
 
 def test_bot():
     '''
     something
     '''
     assert True
+
+def test_filter():
+    '''
+    chatter stops at the substring scan, operator look-alikes at the parse
+    '''
+    f = PropsFilter()
+    assert f.operation('lunch anyone?') is None
+    assert f.operation(None) is None
+    assert f.operation('well done alice:grit++') == ('alice', 'grit', '++', None)
+    assert f.operation('nice one <@U123>:kindness+=3') == ('<@U123>', 'kindness', '+=', '3')
+    assert f.operation('bob--') == ('bob', None, '--', None)
+    assert f.operation('-- ++') is None
+    assert f.operation('alice+=') is None
+    assert f.operation('alice+= bob:grit-=2') == ('bob', 'grit', '-=', '2')
+    assert f.counts['prefilter'] == 2
+    assert f.counts['parse'] == 2
+    assert f.counts['passed'] == 4
+
+def test_filter_benchmark():
+    '''
+    benchmark: non props chatter through the filter
+    '''
+    f = PropsFilter()
+    messages = ['has anyone seen the build logs from this morning?'] * 100000
+    start = time.perf_counter()
+    for message in messages:
+        f.operation(message)
+    elapsed = time.perf_counter() - start
+    print(f'\nprefilter: {elapsed / len(messages) * 1e6:.2f}us/message')
+    assert f.counts['prefilter'] == len(messages)
+    assert elapsed / len(messages) < 50e-6
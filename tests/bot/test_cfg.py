@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from decouple import Config, RepositoryEnv
+
+from props.bot.cfg import (
+    Snapshot,
+    ReloadableConfig,
+    AutoConfigPlus,
+    MissingSettingsError,
+    InvalidSettingError,
+    ImmutableSnapshotError,
+)
+
+ENV = '''
+SLACK_VERIFICATION_TOKEN=token
+SLACK_TEAM_ID=T123
+BOT_USER_OAUTH_ACCESS_TOKEN=xoxb-1
+PROPS_BOT_CHANNEL_ID=C123
+LOG_LEVEL=20
+'''
+
+@pytest.fixture
+def envdir(tmpdir, monkeypatch):
+    for line in ENV.split():
+        monkeypatch.delenv(line.split('=')[0], raising=False)
+    tmpdir.join('.env').write(ENV)
+    return tmpdir
+
+def test_snapshot_typed(envdir):
+    '''
+    settings are cast according to the schema
+    '''
+    snapshot = Snapshot(Config(RepositoryEnv(str(envdir.join('.env')))))
+    assert snapshot.SLACK_TEAM_ID == 'T123'
+    assert snapshot.LOG_LEVEL == 20
+    with pytest.raises(ImmutableSnapshotError):
+        snapshot.SLACK_TEAM_ID = 'T999'
+
+def test_snapshot_missing(envdir):
+    '''
+    missing required settings fail fast, all at once
+    '''
+    envdir.join('.env').write('LOG_LEVEL=20\n')
+    with pytest.raises(MissingSettingsError) as error:
+        Snapshot(Config(RepositoryEnv(str(envdir.join('.env')))))
+    assert 'SLACK_TEAM_ID' in str(error.value)
+    assert 'PROPS_BOT_CHANNEL_ID' in str(error.value)
+
+def test_snapshot_tiered_workers(envdir, monkeypatch):
+    '''
+    tiered props are refused with more than one worker sharing the file
+    '''
+    monkeypatch.delenv('APP_WORKERS', raising=False)
+    monkeypatch.delenv('PROPS_BOT_HOT_ENTRIES', raising=False)
+    envdir.join('.env').write(ENV + 'PROPS_BOT_HOT_ENTRIES=1000\n')
+    with pytest.raises(InvalidSettingError) as error:
+        Snapshot(Config(RepositoryEnv(str(envdir.join('.env')))))
+    assert 'APP_WORKERS' in str(error.value)
+    envdir.join('.env').write(ENV + 'PROPS_BOT_HOT_ENTRIES=1000\nAPP_WORKERS=1\n')
+    assert Snapshot(Config(RepositoryEnv(str(envdir.join('.env'))))).PROPS_BOT_HOT_ENTRIES == 1000
+
+def test_reload_swaps_snapshot(envdir):
+    '''
+    reload swaps in a new snapshot and keeps the old one on bad input
+    '''
+    config = ReloadableConfig(str(envdir), factory=AutoConfigPlus)
+    before = config.snapshot
+    envdir.join('.env').write(ENV.replace('T123', 'T456'))
+    assert config.reload().SLACK_TEAM_ID == 'T456'
+    assert before.SLACK_TEAM_ID == 'T123'
+    envdir.join('.env').write('LOG_LEVEL=20\n')
+    assert config.reload().SLACK_TEAM_ID == 'T456'
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+import threading
+
+from functools import partial
+
+from props.bot import commands
+from props.bot.teams import Team
+from props.bot.deferred import Deferred
+
+def team():
+    team = Team('T1', 'xoxb', 'token', 'C1')
+    team.directory.load([dict(id='U1', name='alice'), dict(id='U2', name='bob')])
+    team.add('C1', 'alice', 'grit', 3)
+    team.add('C2', 'alice', 'kindness', 1)
+    team.add('C2', 'bob', 'grit', 5)
+    return team
+
+def run(text, channel='C1'):
+    func, args = commands.parse(text)
+    return commands.run(func, team(), channel, args)['text']
+
+def test_commands():
+    '''
+    leaderboards are channel scoped in props channels, global elsewhere
+    '''
+    assert commands.parse('') == (None, [])
+    assert commands.parse('dance') == (None, [])
+    assert run('leaderboard') == 'top props here:\n1. alice:grit => 3'
+    assert run('leaderboard global grit 1') == 'top props everywhere:\n1. bob:grit => 5'
+    assert run('top', channel='C2') == 'top props everywhere:\n1. bob:grit => 5\n2. alice:grit => 3\n3. alice:kindness => 1'
+    assert run('stats <@U1>') == 'alice:grit => 3\nalice:kindness => 1\ntotal => 4'
+    assert run('stats carol') == 'carol has no props yet'
+    assert run('history bob').endswith(' bob:grit => 5')
+    assert run('history').startswith('history needs a user\nusage:')
+
+class FakeSession:
+    def __init__(self):
+        self.posts = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, data, headers, timeout):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+            self.posts.append((url, data))
+        return self
+
+    def raise_for_status(self):
+        pass
+
+def test_deferred():
+    '''
+    queries post to the response url, never more than workers at a time
+    '''
+    session = FakeSession()
+    deferred = Deferred(workers=2, session=session)
+    def query(i):
+        if i == 3:
+            raise ValueError('boom')
+        return commands.ephemeral(f'result {i}')
+    async def main():
+        tasks = [deferred.submit(f'https://hooks/{i}', partial(query, i)) for i in range(6)]
+        await asyncio.gather(*tasks)
+    asyncio.get_event_loop().run_until_complete(main())
+    posts = dict(session.posts)
+    assert len(posts) == 6 and session.peak == 2
+    assert b'"text":"result 0"' in posts['https://hooks/0']
+    assert b'boom' in posts['https://hooks/3']
+    assert not deferred.tasks
+
+def test_leaderboard_steps():
+    '''
+    a leaderboard yields between chunks of cells and returns the response,
+    which a deferred run posts
+    '''
+    big = Team('T1', 'xoxb', 'token', 'C1')
+    for i in range(2500):
+        big.add('D1', f'user{i}', None, i)
+    steps = commands.steps(commands.leaderboard, big, 'D1', ['1'])
+    yields = 0
+    while True:
+        try:
+            next(steps)
+            yields += 1
+        except StopIteration as stop:
+            result = stop.value
+            break
+    assert yields == 2
+    assert result['text'] == 'top props everywhere:\n1. user2499:None => 2499'
+    assert commands.run(commands.leaderboard, big, 'D1', ['1']) == result
+
+    session = FakeSession()
+    deferred = Deferred(workers=1, session=session)
+    async def main():
+        await deferred.submit('https://hooks/top', partial(commands.steps, commands.leaderboard, big, 'D1', ['1']))
+    asyncio.get_event_loop().run_until_complete(main())
+    assert b'user2499' in dict(session.posts)['https://hooks/top']
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from props.bot.digest import Cron, CronSpecError, Digest, SharedDigest, RunMarker
+
+def test_cron():
+    '''
+    fridays at 16:00, sunday is 0
+    '''
+    cron = Cron('0 16 * * 5')
+    assert cron.matches(datetime(2026, 10, 23, 16, 0))
+    assert not cron.matches(datetime(2026, 10, 23, 16, 1))
+    assert not cron.matches(datetime(2026, 10, 22, 16, 0))
+    assert Cron('*/15 9-17 * * 1,3').matches(datetime(2026, 10, 19, 9, 45))
+    assert Cron('0 0 * * 0').matches(datetime(2026, 10, 18, 0, 0))
+    assert cron.latest(datetime(2026, 10, 23, 16, 30)) == datetime(2026, 10, 23, 16, 0)
+    assert cron.latest(datetime(2026, 10, 23, 17, 30)) is None
+    with pytest.raises(CronSpecError):
+        Cron('0 16 * *')
+
+def test_digest():
+    '''
+    running totals, top n and reset
+    '''
+    digest = Digest()
+    for name, prop, delta in [('alice', 'kindness', 1), ('bob', 'grit', 3), ('alice', 'kindness', 4), ('carol', None, -1)]:
+        digest.record(name, prop, delta)
+    assert digest.top(1) == [(('alice', 'kindness'), 5)]
+    assert digest.message() == 'top props this period:\n1. alice:kindness +5\n2. bob:grit +3'
+    digest.reset()
+    assert digest.message() is None
+
+def test_digest_roll():
+    '''
+    a period rolls over once per run, never back to an earlier one
+    '''
+    digest = Digest()
+    digest.record('alice', 'kindness', 1)
+    assert digest.roll(datetime(2019, 1, 4, 16, 0))
+    assert digest.totals == {}
+    digest.record('bob', 'grit', 2)
+    assert not digest.roll(datetime(2019, 1, 4, 16, 0))
+    assert not digest.roll(datetime(2018, 12, 28, 16, 0))
+    assert digest.top() == [(('bob', 'grit'), 2)]
+    assert digest.roll(datetime(2019, 1, 11, 16, 0)) and digest.top() == []
+
+def test_shared_digest(tmpdir):
+    '''
+    two workers record into one set of totals; a run counts only what came
+    before it and rolls once for both
+    '''
+    path = str(tmpdir.join('digest.T1.sqlite'))
+    first, second = SharedDigest(path), SharedDigest(path)
+    first.record('alice', 'kindness', 1)
+    second.record('alice', 'kindness', 2)
+    second.record('bob', None, 1)
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    assert first.message(until=now) is None
+    message = first.message(until=now + timedelta(minutes=1))
+    assert message == 'top props this period:\n1. alice:kindness +3\n2. bob:None +1'
+    assert second.totals == {('alice', 'kindness'): 3, ('bob', None): 1}
+    when = now + timedelta(minutes=1)
+    assert first.roll(when) and not second.roll(when)
+    assert second.rolled == when and second.totals == {}
+
+def test_run_marker(tmpdir):
+    '''
+    one claim per run, survives a new marker instance, and can be released
+    '''
+    when = datetime(2026, 10, 23, 16, 0)
+    assert RunMarker(str(tmpdir)).claim('digest-T1', when)
+    assert not RunMarker(str(tmpdir)).claim('digest-T1', when)
+    assert RunMarker(str(tmpdir)).claim('digest-T2', when)
+    RunMarker(str(tmpdir)).release('digest-T1', when)
+    assert RunMarker(str(tmpdir)).claim('digest-T1', when)
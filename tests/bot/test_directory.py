@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import random
+import asyncio
+import threading
+import string
+
+from props.bot.directory import Directory, PrefixIndex
+
+def random_names(count, seed=0):
+    rand = random.Random(seed)
+    letters = string.ascii_lowercase
+    return [''.join(rand.choice(letters) for _ in range(rand.randint(4, 12))) + str(i) for i in range(count)]
+
+def test_prefix_index():
+    '''
+    search is case insensitive, ordered and limited
+    '''
+    index = PrefixIndex((name, name) for name in ['Alice', 'alfred', 'bob', 'albert'])
+    assert index.search('al') == ['albert', 'alfred', 'Alice']
+    assert index.search('AL', limit=1) == ['albert']
+    assert index.search('z') == []
+    index.add('alan')
+    index.remove('alfred')
+    assert index.search('al') == ['alan', 'albert', 'Alice']
+    assert 'bob' in index and 'carol' not in index
+
+def test_directory_options():
+    '''
+    member and prop menus read from separate indexes
+    '''
+    directory = Directory()
+    directory.load([dict(id='U1', name='alice'), dict(id='U2', name='bob'), dict(id='U3', name='al', deleted=True)])
+    directory.add_prop('kindness')
+    assert directory.options('props_user', 'a') == [dict(text='alice', value='alice')]
+    assert directory.options('props_prop', 'k') == [dict(text='kindness', value='kindness')]
+
+def test_seed_props():
+    '''
+    props already in the table are offered before anyone gives them again
+    '''
+    directory = Directory()
+    directory.add_prop('kindness')
+    directory.seed_props(['grit', None, 'kindness', 'grace'])
+    assert directory.options('props_prop', 'g') == [dict(text='grace', value='grace'), dict(text='grit', value='grit')]
+    assert len(directory.props) == 3
+
+def test_prefix_search_latency():
+    '''
+    benchmark: option search over 50k members stays far below slack's timeout
+    '''
+    names = random_names(50000)
+    start = time.perf_counter()
+    directory = Directory()
+    directory.load([dict(id=f'U{i}', name=name) for i, name in enumerate(names)])
+    build = time.perf_counter() - start
+    prefixes = [name[:2] for name in names[:1000]]
+    start = time.perf_counter()
+    for prefix in prefixes:
+        directory.options('props_user', prefix)
+    search = (time.perf_counter() - start) / len(prefixes)
+    print(f'\nbuild={build * 1000:.1f}ms search={search * 1e6:.1f}us/query')
+    assert search < 0.005
+
+def test_resolution_index():
+    '''
+    ids, mentions, names, display names, aliases and near misses resolve
+    '''
+    directory = Directory(aliases={'ally': 'alice'})
+    directory.load([
+        dict(id='U1', name='alice', profile=dict(display_name='Alice Liddell')),
+        dict(id='U2', name='bob'),
+    ])
+    assert directory.resolve('<@U1>')['name'] == 'alice'
+    assert directory.resolve('<@U2|bob>')['name'] == 'bob'
+    assert directory.resolve('u2')['name'] == 'bob'
+    assert directory.resolve('ALICE')['name'] == 'alice'
+    assert directory.resolve('alice liddell')['name'] == 'alice'
+    assert directory.resolve('ally')['name'] == 'alice'
+    assert directory.resolve('alise')['name'] == 'alice'
+    assert directory.resolve('alise', fuzzy=False) is None
+    assert directory.resolve('mallory') is None
+    directory.upsert(dict(id='U2', name='robert', real_name='Robert', profile=dict(display_name='rob', image_72='x')))
+    assert directory.resolve('bob', fuzzy=False) is None
+    assert directory.resolve('robert')['id'] == 'U2'
+    assert directory.members['U2'] == Directory.slim(directory.members['U2'])
+    assert directory.members['U2']['profile'] == dict(display_name='rob', display_name_normalized=None)
+
+def test_stale_membership():
+    '''
+    confirmed channel members are served stale while slack is unavailable
+    '''
+    from resilience import CircuitOpenError # the module directory.py sees
+    def unavailable(member_id):
+        raise CircuitOpenError('conversations.members')
+    directory = Directory(ttl=0)
+    assert directory.in_channel('C1', 'U1', lambda member_id: True)
+    assert directory.in_channel('C1', 'U1', unavailable)
+    assert not directory.in_channel('C1', 'U2', unavailable)
+
+def test_cached_membership():
+    '''
+    confirmations are per channel and served from the cache within the ttl
+    '''
+    checks = []
+    def check(member_id):
+        checks.append(member_id)
+        return member_id == 'U1'
+    directory = Directory()
+    assert directory.in_channel('C1', 'U1', check)
+    assert directory.in_channel('C1', 'U1', check)
+    assert not directory.in_channel('C1', 'U2', check)
+    assert directory.in_channel('C2', 'U1', check)
+    assert checks == ['U1', 'U2', 'U1']
+
+def test_membership_on_loop_thread():
+    '''
+    ain_channel runs only the check in the executor; the caches are read and
+    pruned on the loop thread, however many checks are in flight
+    '''
+    from resilience import CircuitOpenError
+    checked, settled = set(), set()
+    def check(member_id):
+        checked.add(threading.get_ident())
+        time.sleep(0.001)
+        if member_id == 'U0':
+            raise CircuitOpenError('conversations.members')
+        return True
+    directory = Directory(ttl=60)
+    settle = directory.settle
+    def recording(*args):
+        settled.add(threading.get_ident())
+        return settle(*args)
+    directory.settle = recording
+    async def run():
+        return await asyncio.gather(*(directory.ain_channel('C1', f'U{i % 50}', check) for i in range(200)))
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(run())
+    finally:
+        loop.close()
+    assert results.count(False) == 4 and len(directory.confirmed) == 49
+    assert settled == {threading.get_ident()} and threading.get_ident() not in checked
+
+def test_confirmed_pruned():
+    '''
+    confirmations past the ttl are dropped, so the cache stays bounded
+    '''
+    directory = Directory(ttl=60)
+    for i in range(100):
+        directory.in_channel('C1', f'U{i}', lambda member_id: True)
+    assert len(directory.confirmed) == 100
+    for key in list(directory.confirmed)[:90]:
+        directory.confirmed[key] -= 120
+    directory.in_channel('C2', 'U1', lambda member_id: True)
+    assert len(directory.confirmed) == 11
+    assert ('C1', 'U0') not in directory.confirmed and ('C1', 'U99') in directory.confirmed
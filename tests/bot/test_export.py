@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import asyncio
+
+import pytest
+
+from props.bot.table import PropsTable
+from props.bot.export import export, parse_time, ExportFormatError, ExportTimeError
+
+def collect(table, fmt, chunk_rows=2, **filters):
+    async def run():
+        return [chunk async for chunk in export(table, fmt, chunk_rows, **filters)]
+    return asyncio.get_event_loop().run_until_complete(run())
+
+@pytest.fixture
+def table():
+    table = PropsTable()
+    table.add('alice', 'kindness', 3, when=100)
+    table.add('alice', 'grit', 1, when=200)
+    table.add('bob', 'kindness', 2, when=300)
+    table.add('carol', None, -1, when=400)
+    return table
+
+def test_export_ndjson(table):
+    '''
+    one json object per line, in chunks of chunk_rows
+    '''
+    chunks = collect(table, 'ndjson')
+    assert len(chunks) == 2
+    rows = [json.loads(line) for line in b''.join(chunks).splitlines()]
+    assert rows[0] == dict(name='alice', prop='kindness', value=3, updated=100)
+    assert [row['name'] for row in rows] == ['alice', 'alice', 'bob', 'carol']
+
+def test_export_csv(table):
+    '''
+    a header row then one row per cell
+    '''
+    text = b''.join(collect(table, 'csv')).decode('utf-8')
+    rows = list(csv.reader(text.splitlines()))
+    assert rows[0] == ['name', 'prop', 'value', 'updated']
+    assert rows[1:] == [
+        ['alice', 'kindness', '3', '100'],
+        ['alice', 'grit', '1', '200'],
+        ['bob', 'kindness', '2', '300'],
+        ['carol', '', '-1', '400'],
+    ]
+
+def test_export_filters(table):
+    '''
+    user, prop and [since, until) filters
+    '''
+    def names(**filters):
+        return [(row['name'], row['prop']) for row in map(json.loads, b''.join(collect(table, 'ndjson', **filters)).splitlines())]
+    assert names(name='alice') == [('alice', 'kindness'), ('alice', 'grit')]
+    assert names(name='dave') == []
+    assert names(prop='kindness') == [('alice', 'kindness'), ('bob', 'kindness')]
+    assert names(prop='patience') == []
+    assert names(since=200, until=400) == [('alice', 'grit'), ('bob', 'kindness')]
+    assert names(name='alice', since=150) == [('alice', 'grit')]
+
+def test_export_errors(table):
+    with pytest.raises(ExportFormatError):
+        collect(table, 'xml')
+    assert parse_time(None) is None
+    assert parse_time('1500') == 1500
+    assert parse_time('1970-01-02') == 86400
+    with pytest.raises(ExportTimeError):
+        parse_time('yesterday')
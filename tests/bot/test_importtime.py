@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+BOTPATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'props', 'bot'))
+BUDGET = float(os.environ.get('PROPS_BOT_IMPORT_BUDGET', 0.2)) # of main's whole import, libraries included
+RUNS = 3
+MODULES = frozenset(name[:-3] for name in os.listdir(BOTPATH) if name.endswith('.py'))
+
+ENV = dict(
+    SLACK_VERIFICATION_TOKEN='token',
+    SLACK_TEAM_ID='T123',
+    BOT_USER_OAUTH_ACCESS_TOKEN='xoxb-1',
+    PROPS_BOT_CHANNEL_ID='C123',
+)
+
+DEFERRED = (
+    'attrdict',
+    'slackclient',
+    'ruamel',
+    'sh',
+    'utils',
+    'websockets',
+    'cProfile',
+    'difflib',
+    'requests',
+    'sqlite3',
+)
+
+def importtime(module):
+    '''
+    [(name, self us, cumulative us, parent)] from python -X importtime, where
+    parent is the module whose import pulled name in
+    '''
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BOTPATH,
+        env=dict(os.environ, **ENV),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True)
+    assert result.returncode == 0, result.stderr
+    entries = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            own, cumulative, name = line[len('import time:'):].split('|')
+            if own.strip().isdigit():
+                entries.append((name.rstrip(), int(own), int(cumulative)))
+    imports = []
+    for i, (name, own, cumulative) in enumerate(entries):
+        depth = len(name) - len(name.lstrip())
+        parents = (other.strip() for other, _, _ in entries[i + 1:] if len(other) - len(other.lstrip()) < depth)
+        parent = next(parents, None)
+        imports.append((name.strip(), own, cumulative, parent))
+    return imports
+
+def test_import_budget():
+    '''
+    this repo's own modules take at most BUDGET of main's import time, the
+    libraries they pull in measured in the same run as the baseline, so the
+    check holds on slow and fast machines alike; the best of RUNS runs, the
+    first of which may be compiling bytecode. none of them imports a
+    deferred module
+    '''
+    pytest.importorskip('quart')
+    pytest.importorskip('decouple')
+    shares = []
+    for _ in range(RUNS):
+        imports = importtime('main')
+        own = sum(us for name, us, _, _ in imports if name in MODULES)
+        total = next(cumulative for name, _, cumulative, _ in imports if name == 'main')
+        shares.append((own / total, own, total))
+    share, own, total = min(shares)
+    assert share < BUDGET, f'repo modules took {own}us of main\'s {total}us import, {share:.0%} (budget {BUDGET:.0%})'
+    eager = [(name, parent) for name, _, _, parent in imports if name in DEFERRED and parent in MODULES]
+    assert not eager, f'imported at module level: {eager}'
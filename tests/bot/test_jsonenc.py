@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+import pytest
+
+from props.bot import jsonenc
+
+def payload(rows=100000):
+    return dict(leaderboard=[dict(name=f'user{i}', prop=f'prop{i % 7}', value=i) for i in range(rows)])
+
+@pytest.mark.parametrize('name', list(jsonenc.ENCODERS))
+def test_encoder(name):
+    '''
+    compact by default, pretty on request, bytes with a trailing newline
+    '''
+    try:
+        jsonenc.use(name)
+    except jsonenc.UnknownEncoderError:
+        pytest.skip(f'{name} is not installed')
+    obj = dict(b=1, a=[1, 2], c={None: 'x'})
+    compact = jsonenc.dumps(obj)
+    pretty = jsonenc.dumps(obj, pretty=True)
+    assert isinstance(compact, bytes) and compact.endswith(b'\n')
+    assert b' ' not in compact and b'\n  ' in pretty
+    assert json.loads(compact) == json.loads(pretty) == dict(b=1, a=[1, 2], c={'null': 'x'})
+    jsonenc.use()
+
+def test_encoder_benchmark():
+    '''
+    benchmark: large payloads, every available encoder against the old path
+    '''
+    obj = payload()
+    start = time.perf_counter()
+    (json.dumps(obj, indent=4, sort_keys=True) + '\n').encode('utf-8')
+    results = dict(before=time.perf_counter() - start)
+    for name in jsonenc.ENCODERS:
+        try:
+            jsonenc.use(name)
+        except jsonenc.UnknownEncoderError:
+            continue
+        start = time.perf_counter()
+        jsonenc.dumps(obj)
+        results[name] = time.perf_counter() - start
+    jsonenc.use()
+    print('\n' + ' '.join(f'{name}={elapsed * 1000:.1f}ms' for name, elapsed in results.items()))
+    assert results[jsonenc.ENCODER_NAME] < results['before']
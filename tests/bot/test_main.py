@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import importlib
+
+import pytest
+
+ENV = dict(
+    SLACK_VERIFICATION_TOKEN='token',
+    SLACK_TEAM_ID='T123',
+    BOT_USER_OAUTH_ACCESS_TOKEN='xoxb-1',
+    PROPS_BOT_CHANNEL_ID='C123',
+)
+
+class DownSlack:
+    '''
+    slack that is down for every call
+    '''
+    def __init__(self):
+        self.calls = []
+
+    def api_call(self, method, **kwargs):
+        self.calls.append(method)
+        raise OSError('connection reset')
+
+@pytest.fixture
+def main(monkeypatch):
+    pytest.importorskip('quart')
+    pytest.importorskip('decouple')
+    try:
+        import attrdict #pylint: disable=unused-import
+    except ImportError as ex:
+        pytest.skip(f'attrdict unavailable: {ex}')
+    for key, value in ENV.items():
+        monkeypatch.setenv(key, value)
+    main = importlib.import_module('main')
+    monkeypatch.setattr(main, 'dbg', lambda *args, **kwargs: None) # utils is a submodule
+    return main
+
+def test_handle_event_slack_down(main):
+    '''
+    a failing slack call is logged, not raised, so the webhook still acks and
+    slack never retries the event into a second prop
+    '''
+    from lazy import attrdict
+    from teams import Team, RateLimitedSlack
+    from resilience import ResilientSlack
+    team = Team('T1', 'xoxb', 'token', 'C1')
+    slack = DownSlack()
+    team._slack = RateLimitedSlack(ResilientSlack(slack, retries=0), team.limiter, 'T1')
+    team.directory.load([dict(id='U1', name='alice', profile={})])
+    team.directory.channels['C1'] = {'U1'}
+    main.TEAMS.teams['T1'] = team
+    event = attrdict(dict(team_id='T1', event=dict(type='message', channel='C1', user='U2', text='alice++')))
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main.handle_event(event))
+    finally:
+        del main.TEAMS.teams['T1']
+        loop.close()
+    assert team.props.get('alice', None) == 1
+    assert slack.calls == ['conversations.members', 'chat.postMessage']
+
+def test_handle_event_no_operand(main):
+    '''
+    += with no operand is chatter, not a prop: nothing is looked up,
+    counted or posted
+    '''
+    from lazy import attrdict
+    from teams import Team, RateLimitedSlack
+    team = Team('T1', 'xoxb', 'token', 'C1')
+    slack = DownSlack()
+    team._slack = RateLimitedSlack(slack, team.limiter, 'T1')
+    team.directory.load([dict(id='U1', name='alice', profile={})])
+    main.TEAMS.teams['T1'] = team
+    event = attrdict(dict(team_id='T1', event=dict(type='message', channel='C1', user='U2', text='alice+=')))
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main.handle_event(event))
+    finally:
+        del main.TEAMS.teams['T1']
+        loop.close()
+    assert team.props.get('alice', None) == 0
+    assert slack.calls == []
+
+class FakeSession:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, data, headers, timeout):
+        self.posts.append((url, data))
+        return self
+
+    def raise_for_status(self):
+        pass
+
+def test_props_bot_route(main, monkeypatch):
+    '''
+    a slash command posted to /props-bot is acked at once and answered
+    through its response_url
+    '''
+    from deferred import Deferred
+    session = FakeSession()
+    deferred = Deferred(session=session)
+    monkeypatch.setattr(main, 'DEFERRED', deferred)
+    team = main.TEAMS.get('T123')
+    team.add('C123', 'alice', 'grit', 2)
+    form = dict(
+        token='token',
+        team_id='T123',
+        channel_id='C123',
+        text='stats alice',
+        response_url='https://hooks/1')
+    async def post():
+        response = await main.app.test_client().post('/props-bot', form=form)
+        body = await response.get_json()
+        await asyncio.gather(*deferred.tasks)
+        return response.status_code, body
+    loop = asyncio.new_event_loop()
+    try:
+        status, body = loop.run_until_complete(post())
+    finally:
+        loop.close()
+    assert status == 200 and body['text'] == 'working…'
+    assert session.posts[0][0] == 'https://hooks/1'
+    assert b'alice:grit => 2' in session.posts[0][1]
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from props.bot.pagination import paginate, apaginate, PaginationError
+from props.bot.directory import Directory
+
+class FakeSlack:
+    '''
+    serves users.list in pages of limit members, following cursors
+    '''
+    def __init__(self, count):
+        self.members = [dict(id=f'U{i}', name=f'user{i}') for i in range(count)]
+        self.calls = []
+
+    def api_call(self, method, limit=200, cursor=None, **kwargs):
+        self.calls.append(cursor)
+        if method != 'users.list':
+            return dict(ok=False, error='unknown_method')
+        start = int(cursor or 0)
+        end = start + limit
+        more = end < len(self.members)
+        return dict(ok=True, members=self.members[start:end], response_metadata=dict(next_cursor=str(end) if more else ''))
+
+def test_paginate():
+    '''
+    every page is followed and iteration stops early when the caller does
+    '''
+    slack = FakeSlack(1000)
+    assert len(list(paginate(slack, 'users.list', 'members', limit=100))) == 1000
+    assert len(slack.calls) == 10
+    slack.calls = []
+    found = next(member for member in paginate(slack, 'users.list', 'members', limit=100) if member['name'] == 'user150')
+    assert found['id'] == 'U150'
+    assert len(slack.calls) == 2
+    with pytest.raises(PaginationError):
+        list(paginate(slack, 'users.info', 'members'))
+
+def test_apaginate_and_directory():
+    '''
+    async pages feed the directory refresh
+    '''
+    slack = FakeSlack(450)
+    loop = asyncio.new_event_loop()
+    async def collect():
+        return [member async for member in apaginate(slack, 'users.list', 'members')]
+    assert len(loop.run_until_complete(collect())) == 450
+    directory = Directory(slack)
+    loop.run_until_complete(directory.arefresh())
+    loop.close()
+    assert len(directory.members) == 450
+    assert directory.resolve('user449')['id'] == 'U449'
+    directory.refresh()
+    assert len(directory.members) == 450
+
+def test_directory_afind():
+    '''
+    a cold directory streams pages only until the target resolves
+    '''
+    slack = FakeSlack(1000)
+    directory = Directory(slack)
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(directory.afind('user250'))['id'] == 'U250'
+    assert len(slack.calls) == 2
+    assert loop.run_until_complete(directory.afind('<@U10>'))['name'] == 'user10'
+    assert len(slack.calls) == 2
+    loop.close()
+
+def test_directory_afind_exact():
+    '''
+    afind never hands back a near miss unless asked to
+    '''
+    directory = Directory(FakeSlack(10))
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(directory.afind('usr5')) is None
+    assert loop.run_until_complete(directory.afind('usr5', fuzzy=True))['name'] == 'user5'
+    loop.close()
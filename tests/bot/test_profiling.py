@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+
+import pytest
+
+from props.bot.profiling import Profiler, ProfileSortError, PROFILE_HEADER
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+async def handler(profiler, delay=0.0):
+    with profiler.section('work'):
+        time.sleep(delay)
+    return 'ok'
+
+def test_profiled_request():
+    '''
+    the header token turns on cProfile and records sections
+    '''
+    profiler = Profiler(token='secret')
+    assert run(profiler.run('events', {PROFILE_HEADER: 'secret'}, handler, profiler)) == 'ok'
+    capture = profiler.captures[-1]
+    assert capture.summary()['profiled']
+    assert 'work' in capture.summary()['sections_ms']
+    assert 'handler' in capture.stats()
+    assert 'handler' in capture.stats('tottime')
+    with pytest.raises(ProfileSortError):
+        capture.stats('bogus')
+
+def test_slow_request_capture():
+    '''
+    requests over the threshold are kept with the stack the watchdog saw
+    '''
+    profiler = Profiler(slow_ms=20)
+    run(profiler.run('events', {}, handler, profiler, 0.001))
+    assert not profiler.captures
+    run(profiler.run('events', {}, handler, profiler, 0.1))
+    capture = profiler.captures[-1]
+    assert not capture.summary()['profiled']
+    assert capture.summary()['elapsed_ms'] >= 100
+    assert any('handler' in line for line in capture.stack)
+
+def test_disabled():
+    '''
+    nothing is recorded and sections are no-ops when disabled
+    '''
+    profiler = Profiler()
+    assert not profiler.enabled
+    with profiler.section('work'):
+        pass
+    assert not profiler.captures
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+
+from functools import partial
+
+from props.bot.replay import replay, main
+from props.bot.teams import Team
+from props.bot.tiered import TieredTable
+
+USERS = [
+    {'id': 'U1', 'name': 'alice', 'profile': {'display_name': 'ally'}},
+    {'id': 'U2', 'name': 'bob', 'profile': {}},
+]
+
+def export(tmpdir):
+    '''
+    a two channel Slack export with users.json and channels.json
+    '''
+    tmpdir.join('users.json').write(json.dumps(USERS))
+    tmpdir.join('channels.json').write(json.dumps([{'id': 'C1', 'name': 'general'}, {'id': 'C2', 'name': 'random'}]))
+    tmpdir.mkdir('general').join('2019-01-01.json').write(json.dumps([
+        {'type': 'message', 'text': 'alice:kindness++'},
+        {'type': 'message', 'text': 'thanks <@U1>:kindness+=3'},
+        {'type': 'message', 'text': 'bob:grit--'},
+        {'type': 'message', 'text': 'mallory:grit++'},
+        {'type': 'message', 'text': 'just chatting'},
+        {'type': 'message', 'subtype': 'bot_message', 'text': 'alice:kindness++'},
+    ]))
+    tmpdir.mkdir('random').join('2019-01-02.json').write(json.dumps([
+        {'type': 'message', 'text': 'ally:kindness++'},
+    ]))
+    return tmpdir
+
+def test_replay_export(tmpdir):
+    '''
+    a Slack export is folded into the team's global table and its props
+    channel's, with mentions and display names resolved like live events
+    '''
+    path = export(tmpdir.mkdir('export'))
+    team = Team('T1', None, None, 'C1', store=partial(TieredTable, str(tmpdir.join('props.sqlite')), hot_entries=2))
+    team.directory.load(USERS)
+    assert replay(team, str(path), batch_size=2) == 4
+    assert team.props.as_dict() == {'alice': {'kindness': 5}, 'bob': {'grit': -1}}
+    assert team.channel_props('C1').as_dict() == {'alice': {'kindness': 4}, 'bob': {'grit': -1}}
+    assert set(team.channel_tables) == {'C1'}
+
+def test_replay_jsonl(tmpdir):
+    '''
+    event_callback envelopes in a JSONL dump are unwrapped; without a
+    directory names are taken as written
+    '''
+    team = Team('T1', None, None, store=partial(TieredTable, str(tmpdir.join('props.sqlite'))))
+    dump = tmpdir.join('events.jsonl')
+    dump.write('\n'.join(json.dumps({'event': {'type': 'message', 'text': 'carol:tests++'}}) for _ in range(5)))
+    assert replay(team, str(dump)) == 5
+    assert team.props.as_dict() == {'carol': {'tests': 5}}
+
+def test_replay_main(tmpdir):
+    '''
+    the command line replays into props.<team>.sqlite, where the bot's
+    tiered store finds it
+    '''
+    path = export(tmpdir.mkdir('export'))
+    state = tmpdir.mkdir('state')
+    main([str(path), '--team', 'T1', '--state-path', str(state), '--props-channel', 'C2', '--hot-entries', '2'])
+    path = str(state.join('props.T1.sqlite'))
+    assert TieredTable(path).as_dict() == {'alice': {'kindness': 5}, 'bob': {'grit': -1}}
+    assert TieredTable(path, 'C2').as_dict() == {'alice': {'kindness': 1}}
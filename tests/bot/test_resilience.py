@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from props.bot.resilience import ResilientSlack, CircuitBreaker, CircuitOpenError, SlackUnavailableError, Deadline
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+    def sleep(self, seconds):
+        self.now += seconds
+
+class FlakySlack:
+    '''
+    returns the scripted results in order, then ok
+    '''
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+    def api_call(self, method, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0) if self.results else dict(ok=True)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+def resilient(slack, clock, **kwargs):
+    return ResilientSlack(slack, sleep=clock.sleep, clock=clock, **kwargs)
+
+def test_retries_then_succeeds():
+    '''
+    transient errors are retried with backoff, Retry-After is honoured
+    '''
+    clock = Clock()
+    ratelimited = dict(ok=False, error='ratelimited', headers={'Retry-After': '1'})
+    slack = FlakySlack(OSError('reset'), ratelimited)
+    assert resilient(slack, clock, retries=2, budget=2.5).api_call('users.list') == dict(ok=True)
+    assert slack.calls == 3
+    assert clock.now >= 1.0
+
+def test_non_retryable_errors_pass_through():
+    '''
+    slack errors that retrying won't fix come back as json, as before
+    '''
+    clock = Clock()
+    slack = FlakySlack(dict(ok=False, error='channel_not_found'))
+    assert resilient(slack, clock).api_call('conversations.members')['error'] == 'channel_not_found'
+    assert slack.calls == 1
+
+def test_deadline():
+    '''
+    a Retry-After past the deadline gives up instead of sleeping
+    '''
+    clock = Clock()
+    slack = FlakySlack(dict(ok=False, error='ratelimited', headers={'Retry-After': '30'}))
+    with pytest.raises(SlackUnavailableError):
+        resilient(slack, clock, budget=2.5).api_call('users.list')
+    assert clock.now == 0.0
+
+def test_shared_deadline():
+    '''
+    calls made through one Deadline share its budget instead of each
+    getting a fresh one, and none is attempted once it has run out
+    '''
+    clock = Clock()
+    ratelimited = dict(ok=False, error='ratelimited', headers={'Retry-After': '1'})
+    slack = FlakySlack(ratelimited, dict(ok=True), ratelimited)
+    client = Deadline(resilient(slack, clock, budget=2.5), budget=1.5, clock=clock)
+    assert client.api_call('conversations.members') == dict(ok=True)
+    assert clock.now == 1.0
+    with pytest.raises(SlackUnavailableError):
+        client.api_call('chat.postMessage')
+    assert slack.calls == 3
+    clock.now = 1.5
+    with pytest.raises(SlackUnavailableError):
+        client.api_call('chat.postMessage')
+    assert slack.calls == 3
+
+def test_breaker_opens_and_recovers():
+    '''
+    consecutive failures open the breaker; after reset one trial closes it
+    '''
+    clock = Clock()
+    errors = [dict(ok=False, error='service_unavailable')] * 2
+    slack = FlakySlack(*errors)
+    client = resilient(slack, clock, retries=0, threshold=2, reset=10)
+    for _ in range(2):
+        with pytest.raises(SlackUnavailableError):
+            client.api_call('users.list')
+    with pytest.raises(CircuitOpenError):
+        client.api_call('users.list')
+    assert client.api_call('chat.postMessage') == dict(ok=True)
+    clock.now += 10
+    assert client.breaker('users.list').state == 'half-open'
+    assert client.api_call('users.list') == dict(ok=True)
+    assert client.breaker('users.list').state == 'closed'
+
+def test_half_open_allows_one_trial():
+    '''
+    only one trial call goes through while half open
+    '''
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=1, reset=5, clock=clock)
+    breaker.failure()
+    assert not breaker.allow()
+    clock.now = 5
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == 'open'
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+
+from datetime import datetime
+
+from props.bot import snapshot
+from props.bot.digest import Digest
+from props.bot.directory import Directory
+
+def members(count):
+    return [dict(id=f'U{i}', name=f'user{i}', profile=dict(display_name=f'User {i}')) for i in range(count)]
+
+def test_snapshot_roundtrip(tmpdir):
+    '''
+    members, props and confirmed channel members survive a restart
+    '''
+    path = str(tmpdir.join('state', 'directory.T1.snap'))
+    directory = Directory()
+    directory.load(members(3) + [dict(id='U9', name='tab', profile=dict(display_name='a\tb'))])
+    directory.add_prop('kindness')
+    directory.channels['C1'] = {'U1', 'U2'}
+    snapshot.save(directory, path)
+
+    warm = Directory()
+    assert snapshot.restore(warm, path)
+    assert {k: v for k, v in warm.members.items() if k != 'U9'} == {k: v for k, v in directory.members.items() if k != 'U9'}
+    assert warm.members['U9']['profile']['display_name'] == 'a b'
+    assert warm.resolve('user2')['id'] == 'U2'
+    assert warm.options('props_prop', 'k') == [dict(text='kindness', value='kindness')]
+    assert warm.channels == {'C1': {'U1', 'U2'}}
+    assert warm.loaded == directory.loaded and warm.stale is False
+
+def test_snapshot_digest(tmpdir):
+    '''
+    the digest period in progress survives a restart too
+    '''
+    path = str(tmpdir.join('directory.T1.snap'))
+    directory, digest = Directory(), Digest()
+    directory.load(members(1))
+    digest.roll(datetime(2019, 1, 4, 16, 0))
+    digest.record('alice', 'kindness', 3)
+    digest.record('bob', None, -1)
+    snapshot.save(directory, path, digest)
+
+    warm = Digest()
+    assert snapshot.restore(Directory(), path, warm)
+    assert warm.totals == digest.totals
+    assert warm.rolled == datetime(2019, 1, 4, 16, 0)
+    assert snapshot.restore(Directory(), path)
+
+def test_snapshot_missing_or_corrupt(tmpdir):
+    directory = Directory()
+    assert not snapshot.restore(directory, str(tmpdir.join('missing.snap')))
+    path = tmpdir.join('bad.snap')
+    path.write('not a snapshot\n')
+    assert not snapshot.restore(directory, str(path))
+    path.write('')
+    assert not snapshot.restore(directory, str(path))
+    assert not directory.loaded
+
+def test_snapshot_benchmark(tmpdir):
+    '''
+    benchmark: restoring 50k members from a snapshot
+    '''
+    path = str(tmpdir.join('directory.snap'))
+    directory = Directory()
+    directory.load(members(50000))
+    snapshot.save(directory, path)
+    start = time.perf_counter()
+    snapshot.restore(Directory(), path)
+    elapsed = time.perf_counter() - start
+    print(f'\nrestore: {elapsed * 1000:.0f}ms for 50000 members')
+    assert elapsed < 5
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import asyncio
+
+import pytest
+
+from props.bot.socketmode import SocketModeClient
+
+class StandIn:
+    '''
+    local stand-in for slack's websocket: fails the first connect, then
+    serves the scripted envelopes and records the acks
+    '''
+    def __init__(self, messages, failures=1):
+        self.messages = [json.dumps(message) for message in messages]
+        self.failures = failures
+        self.acks = []
+        self.payloads = {}
+        self.connects = 0
+
+    def __call__(self, url):
+        self.connects += 1
+        if self.connects <= self.failures:
+            raise OSError('connection refused')
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0.001)
+        if not self.messages:
+            raise StopAsyncIteration
+        return self.messages.pop(0)
+
+    async def send(self, raw):
+        ack = json.loads(raw)
+        self.acks.append(ack['envelope_id'])
+        if 'payload' in ack:
+            self.payloads[ack['envelope_id']] = ack['payload']
+
+def test_socket_mode_acks_and_dispatches():
+    '''
+    envelopes are acked, events_api payloads reach the handler, and the
+    client reconnects after a failed connect
+    '''
+    handled = []
+    async def handler(payload):
+        handled.append(payload['event']['text'])
+    standin = StandIn([
+        dict(type='hello'),
+        dict(type='events_api', envelope_id='e1', payload=dict(event=dict(text='alice++'))),
+        dict(type='slash_commands', envelope_id='e2', payload={}),
+        dict(type='disconnect'),
+    ])
+    client = SocketModeClient('xapp-1', handler, url='ws://localhost', connect=standin, backoff_base=0.001)
+    loop = asyncio.new_event_loop()
+    async def run():
+        task = asyncio.ensure_future(client.run())
+        while standin.messages or not handled:
+            await asyncio.sleep(0.001)
+        client.stop()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    loop.run_until_complete(asyncio.wait_for(run(), 5))
+    loop.close()
+    assert standin.connects >= 2
+    assert standin.acks == ['e1', 'e2']
+    assert handled == ['alice++']
+
+def test_socket_mode_responders():
+    '''
+    slash commands and interactive payloads are answered on the ack; an
+    envelope type without a responder is still acked
+    '''
+    async def handler(payload):
+        pass
+    async def command(payload):
+        return dict(text=f'ran {payload["text"]}')
+    standin = StandIn([
+        dict(type='slash_commands', envelope_id='e1', payload=dict(text='top')),
+        dict(type='interactive', envelope_id='e2', payload=dict(actions=[])),
+        dict(type='disconnect'),
+    ], failures=0)
+    client = SocketModeClient(
+        'xapp-1', handler, responders=dict(slash_commands=command), url='ws://localhost', connect=standin)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(asyncio.wait_for(client.session(), 5))
+    loop.close()
+    assert standin.acks == ['e1', 'e2']
+    assert standin.payloads == dict(e1=dict(text='ran top'))
+
+def test_socket_mode_real_socket():
+    '''
+    against a real websocket server on 127.0.0.1: the first connection is
+    acked, dispatched and then closed by the server, and the client
+    reconnects and answers a slash command on the ack of the second, which
+    asks it to reconnect again
+    '''
+    websockets = pytest.importorskip('websockets')
+    acks, handled, connections = [], [], []
+    async def handler(payload):
+        handled.append(payload['event']['text'])
+    async def command(payload):
+        return dict(text=f'ran {payload["text"]}')
+    async def serve(ws, *args):
+        connections.append(ws)
+        await ws.send(json.dumps(dict(type='hello')))
+        if len(connections) == 1:
+            event = dict(type='events_api', envelope_id='e1', payload=dict(event=dict(text='alice++')))
+            await ws.send(json.dumps(event))
+            acks.append(json.loads(await ws.recv()))
+            await ws.close()
+        elif len(connections) == 2:
+            await ws.send(json.dumps(dict(type='slash_commands', envelope_id='e2', payload=dict(text='top'))))
+            acks.append(json.loads(await ws.recv()))
+            await ws.send(json.dumps(dict(type='disconnect')))
+        await ws.wait_closed()
+    async def run():
+        async with websockets.serve(serve, '127.0.0.1', 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            client = SocketModeClient(
+                'xapp-1', handler, responders=dict(slash_commands=command), url=f'ws://127.0.0.1:{port}',
+                backoff_base=0.001)
+            task = asyncio.ensure_future(client.run())
+            while len(acks) < 2 or not handled:
+                await asyncio.sleep(0.01)
+            client.stop()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(asyncio.wait_for(run(), 10))
+    finally:
+        loop.close()
+    assert len(connections) >= 2
+    assert acks == [dict(envelope_id='e1'), dict(envelope_id='e2', payload=dict(text='ran top'))]
+    assert handled == ['alice++']
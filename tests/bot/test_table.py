@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import tracemalloc
+
+from props.bot.table import PropsTable
+
+USERS = 20000
+PROPS = 5
+UPDATE_RUNS = 3
+
+def dict_update(props, name, prop, delta):
+    '''
+    the dict-of-dicts PropsTable replaced, holding the same cells: a value
+    and its last update
+    '''
+    cell = props.setdefault(name, {}).setdefault(prop, [0, 0])
+    cell[0] += delta
+    cell[1] = int(time.time())
+
+def operations():
+    return [(f'user{u}', f'prop{p}', 1) for p in range(PROPS) for u in range(USERS)]
+
+def test_table():
+    '''
+    cells are created on demand and updated in place
+    '''
+    table = PropsTable()
+    assert table.get('alice', 'kindness') == 0
+    assert table.add('alice', 'kindness', 1) == 1
+    assert table.add('alice', 'kindness', 2) == 3
+    assert table.add('alice', None, -1) == -1
+    assert table.add('bob', 'grit', 5) == 5
+    assert len(table) == 3 and 'alice' in table and 'carol' not in table
+    assert table.user_props('alice') == {'kindness': 3, None: -1}
+    assert table.as_dict() == {'alice': {'kindness': 3, None: -1}, 'bob': {'grit': 5}}
+
+def run(factory, update, ops):
+    '''
+    time ops against a fresh store, which creates every cell, and the best
+    of UPDATE_RUNS more, which update them in place; then measure the memory
+    of a second store
+    '''
+    store = factory()
+    elapsed = []
+    for _ in range(1 + UPDATE_RUNS):
+        start = time.perf_counter()
+        for name, prop, delta in ops:
+            update(store, name, prop, delta)
+        elapsed.append(time.perf_counter() - start)
+    elapsed = [elapsed[0], min(elapsed[1:])]
+    tracemalloc.start()
+    store = factory()
+    for name, prop, delta in ops:
+        update(store, name, prop, delta)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return store, elapsed, memory
+
+def test_table_benchmark():
+    '''
+    benchmark: PropsTable holds the same cells in under a third of the
+    dict's memory, for roughly half of its update throughput (2x to 3x
+    slower here, depending on the run), far above any slack event rate
+    either way; the throughput bound leaves room for that noise
+    '''
+    ops = operations()
+    props, dict_times, dict_memory = run(dict, dict_update, ops)
+    table, table_times, table_memory = run(PropsTable, PropsTable.add, ops)
+    report = (
+        f'dict: {dict_memory / 1e6:.1f}MB, {len(ops) / dict_times[0]:.0f} creates/s, '
+        f'{len(ops) / dict_times[1]:.0f} updates/s; '
+        f'table: {table_memory / 1e6:.1f}MB, {len(ops) / table_times[0]:.0f} creates/s, '
+        f'{len(ops) / table_times[1]:.0f} updates/s')
+    assert table.as_dict() == {name: {prop: cell[0] for prop, cell in cells.items()} for name, cells in props.items()}
+    assert table_memory < dict_memory / 3, report
+    assert table_times[1] < dict_times[1] * 4, report
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from types import SimpleNamespace
+
+from props.bot.teams import Team, Teams, RateLimitedSlack, parse_channels
+from props.bot.digest import SharedDigest
+
+def test_parse_channels():
+    assert parse_channels('C1') == ('C1', )
+    assert parse_channels('C1, C2|C3 C1') == ('C1', 'C2', 'C3', 'C1')
+    assert parse_channels(None) == ()
+
+def test_team_channels():
+    '''
+    props channels are an allowlist; the first one gets digests
+    '''
+    team = Team('T1', 'xoxb', 'token', 'C1|C2')
+    assert team.channel_id == 'C1'
+    assert team.allows('C1') and team.allows('C2') and not team.allows('C3')
+    team.configure('xoxb', 'token', 'C3')
+    assert team.channel_id == 'C3' and not team.allows('C1')
+
+def test_team_tallies():
+    '''
+    global and per channel tallies, with leaderboards per partition
+    '''
+    team = Team('T1', 'xoxb', 'token', 'C1,C2')
+    assert team.add('C1', 'alice', 'grit', 3) == (3, 3)
+    assert team.add('C2', 'alice', 'grit', 1) == (4, 1)
+    assert team.add('C2', 'bob', None, 2) == (2, 2)
+    assert team.add('D1', 'bob', None, 1) == (3, None)
+    assert 'D1' not in team.channel_tables
+    assert team.leaderboard() == [('alice', 'grit', 4), ('bob', None, 3)]
+    assert team.leaderboard('C1') == [('alice', 'grit', 3)]
+    assert team.leaderboard('C2', count=1) == [('bob', None, 2)]
+    assert team.leaderboard('C2', prop='grit') == [('alice', 'grit', 1)]
+    assert team.leaderboard('C9') == []
+    assert team.digest.top(1) == [(('alice', 'grit'), 4)]
+
+SETTINGS = dict(
+    SLACK_TEAM_ID='T1',
+    BOT_USER_OAUTH_ACCESS_TOKEN='xoxb',
+    SLACK_VERIFICATION_TOKEN='token',
+    PROPS_BOT_CHANNEL_ID='C1',
+    SLACK_TEAMS='',
+    PROPS_BOT_ALIASES='',
+    PROPS_BOT_HOT_ENTRIES=0,
+    APP_WORKERS=1,
+    PROPS_BOT_STATE_PATH='/tmp',
+    SLACK_RATE_LIMIT=1.0,
+    SLACK_RATE_BURST=20,
+    SLACK_RETRIES=0,
+    SLACK_CALL_BUDGET_MS=1000,
+    SLACK_BREAKER_THRESHOLD=5,
+    SLACK_BREAKER_RESET=30)
+
+def test_teams_subscribe():
+    '''
+    listeners see the teams there are now and every team added later
+    '''
+    teams = Teams().configure(SimpleNamespace(**SETTINGS))
+    started = []
+    teams.subscribe(lambda team: started.append(team.team_id))
+    assert started == ['T1']
+    teams.configure(SimpleNamespace(**dict(SETTINGS, SLACK_TEAMS='T2:xoxb2:token2')))
+    teams.configure(SimpleNamespace(**dict(SETTINGS, SLACK_TEAMS='T2:xoxb2:token3')))
+    assert started == ['T1', 'T2']
+
+def test_teams_hot_entries(tmpdir):
+    '''
+    the global table gets the whole hot cap, channel tables split one more
+    '''
+    settings = dict(SETTINGS, PROPS_BOT_HOT_ENTRIES=100, PROPS_BOT_CHANNEL_ID='C1|C2', PROPS_BOT_STATE_PATH=str(tmpdir))
+    team = Teams().configure(SimpleNamespace(**settings)).get('T1')
+    assert team.props.hot_entries == 100 and team.props.path == str(tmpdir.join('props.T1.sqlite'))
+    assert [team.channel_props(channel).hot_entries for channel in ('C1', 'C2')] == [50, 50]
+
+def test_teams_reload(tmpdir):
+    '''
+    a reload reaches existing teams: aliases, rate limits, resilience and
+    hot caps apply at once, a switch of props storage waits for a restart
+    '''
+    settings = dict(SETTINGS, PROPS_BOT_HOT_ENTRIES=100, PROPS_BOT_CHANNEL_ID='C1|C2', PROPS_BOT_STATE_PATH=str(tmpdir))
+    teams = Teams().configure(SimpleNamespace(**settings))
+    team = teams.get('T1')
+    team.directory.load([dict(id='U1', name='alice', profile={})])
+    for i in range(50):
+        team.add('C1', f'user{i}', 'grit', 1)
+    team._slack = object()
+    teams.configure(SimpleNamespace(**dict(
+        settings, PROPS_BOT_ALIASES='ally=alice', SLACK_RATE_LIMIT=5.0, SLACK_RATE_BURST=3, SLACK_RETRIES=1,
+        PROPS_BOT_HOT_ENTRIES=10)))
+    assert teams.get('T1') is team and team._slack is None
+    assert team.directory.resolve('ally', fuzzy=False)['id'] == 'U1'
+    assert (team.limiter.rate, team.limiter.burst) == (5.0, 3) and team.directory_limiter.burst == 3
+    assert team.limiter.tokens <= 3 and team.resilience['retries'] == 1
+    assert team.props.hot_entries == 10 and len(team.props.hot) <= 10
+    assert team.channel_props('C1').hot_entries == 5 and team.channel_props('C2').hot_entries == 5
+    assert len(team.props) == 50
+    teams.configure(SimpleNamespace(**dict(settings, PROPS_BOT_HOT_ENTRIES=0)))
+    assert team.store.path == str(tmpdir.join('props.T1.sqlite'))
+
+def test_teams_shared_digest(tmpdir):
+    '''
+    with more than one worker the digest totals live in the state path
+    '''
+    teams = Teams().configure(SimpleNamespace(**dict(SETTINGS, APP_WORKERS=2, PROPS_BOT_STATE_PATH=str(tmpdir))))
+    team = teams.get('T1')
+    assert team.digest.shared and team.digest.path == str(tmpdir.join('digest.T1.sqlite'))
+    team.add('C1', 'alice', 'grit', 2)
+    assert SharedDigest(team.digest.path).totals == {('alice', 'grit'): 2}
+
+class Workspace:
+    '''
+    users.list for count members, a page of limit at a time
+    '''
+    def __init__(self, count):
+        self.members = [dict(id=f'U{i}', name=f'user{i}') for i in range(count)]
+        self.calls = 0
+
+    def api_call(self, method, limit=200, cursor=None, **kwargs):
+        self.calls += 1
+        start = int(cursor or 0)
+        end = start + limit
+        return dict(ok=True, members=self.members[start:end], response_metadata=dict(
+            next_cursor=str(end) if end < len(self.members) else ''))
+
+def test_directory_paging_rate_limit():
+    '''
+    a refresh bigger than the burst waits for tokens from its own bucket,
+    so it completes and leaves user facing calls their tokens; lookups that
+    run dry fall back to the cache instead of raising
+    '''
+    team = Team('T1', 'xoxb', 'token', 'C1', rate=1000.0, burst=2)
+    workspace = Workspace(10000)
+    team._slack = RateLimitedSlack(workspace, team.limiter, 'T1')
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(team.directory.arefresh())
+    assert workspace.calls == 50 and team.directory.loaded
+    assert len(team.directory.members) == 10000
+    assert team.limiter.tokens == 2
+    team.directory.members, team.directory.loaded = {}, 0
+    team.limiter.rate, team.limiter.tokens = 0, 0
+    assert loop.run_until_complete(team.directory.afind('user9999')) is None
+    loop.close()
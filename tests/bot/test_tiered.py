@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import random
+import subprocess
+
+import pytest
+
+from props.bot import tiered
+from props.bot.table import PropsTable
+from props.bot.tiered import TieredTable
+
+BOTPATH = os.path.dirname(tiered.__file__)
+
+def table(tmpdir, hot_entries, scope=''):
+    return TieredTable(str(tmpdir.join('props.sqlite')), scope, hot_entries)
+
+def test_tiered_lru(tmpdir):
+    '''
+    cold cells fault back in on access; the cap holds
+    '''
+    props = table(tmpdir, 10)
+    for i in range(25):
+        props.add(f'user{i}', 'grit', i)
+    assert len(props.hot) <= 10 and len(props) == 25
+    assert props.get('user0', 'grit') == 0 and props.faults == 1
+    assert props.add('user1', 'grit', 5) == 6
+    assert ('user1', 'grit') in props.hot
+    assert props.get('nobody', 'grit', None) is None
+    assert 'user3' in props and 'nobody' not in props
+    props.add('user2', None, -1)
+    assert props.user_props('user2') == {'grit': 2, None: -1}
+
+def test_tiered_queries(tmpdir):
+    '''
+    rows, top and as_dict cover both tiers and match an in memory table
+    '''
+    rand = random.Random(0)
+    props, reference = table(tmpdir, 50), PropsTable()
+    for _ in range(2000):
+        name, prop, delta = f'user{rand.randrange(200)}', rand.choice(['grit', 'kindness', None]), rand.randint(-1, 3)
+        when = rand.randrange(1000)
+        props.add(name, prop, delta, when)
+        reference.add(name, prop, delta, when)
+    assert props.as_dict() == reference.as_dict()
+    assert sorted(props.rows(name='user7'), key=str) == sorted(reference.rows(name='user7'), key=str)
+    assert sorted(props.rows(prop='grit', since=100, until=600)) == sorted(reference.rows(prop='grit', since=100, until=600))
+    assert [cell[2] for cell in props.top(5, 'kindness')] == [cell[2] for cell in reference.top(5, 'kindness')]
+
+def test_tiered_rows_interleaved(tmpdir):
+    '''
+    adds that fault and evict cells while rows() is part way through never
+    make a cell show up twice or go missing
+    '''
+    props = table(tmpdir, 20)
+    for i in range(100):
+        props.add(f'user{i:03}', 'grit', i, 1)
+    before = {(name, prop): value for name, prop, value in props.items()}
+    seen = []
+    for i, row in enumerate(props.rows()):
+        seen.append(row)
+        props.add(f'user{(i * 7) % 100:03}', 'grit', 1000)
+        props.add(f'new{i}', 'grit', 1)
+    assert len(seen) == len(before) == 100
+    assert {(name, prop): value for name, prop, value, _ in seen} == before
+    assert len(props.hot) <= 20 and not props.readers
+    assert len(props) == 100 + len(seen)
+    assert props.get('user007', 'grit') == 1007
+
+def test_tiered_batched_faults(tmpdir):
+    '''
+    faults leave shadowed cold copies that are deleted in one batch, and
+    reads never count a cell twice meanwhile
+    '''
+    props = table(tmpdir, 10)
+    for i in range(30):
+        props.add(f'user{i}', 'grit', i)
+    props.flush()
+    props.get('user0', 'grit')
+    assert ('user0', 'grit') in props.shadowed
+    assert props.top(1, 'grit') == [('user29', 'grit', 29)]
+    assert props.user_props('user0') == {'grit': 0}
+    assert props.flush() and not props.shadowed and len(props) == 30
+
+def test_tiered_coalesced_writes(tmpdir):
+    '''
+    evicted cells wait in spilled: touching one again costs no sqlite read
+    or write, reads see it meanwhile, and a flush writes it once
+    '''
+    props = TieredTable(str(tmpdir.join('props.sqlite')), '', 10, flush_entries=100)
+    for i in range(30):
+        props.add(f'user{i}', 'grit', i)
+    assert props.spilled and not props.writes and not props.faults
+    assert props.get('user0', 'grit') == 0 and props.faults == 0
+    assert props.user_props('user1') == {'grit': 1} and 'user2' in props
+    assert props.top(1, 'grit') == [('user29', 'grit', 29)]
+    assert len(props) == 30 and not props.spilled and props.writes == 20
+    assert props.get('user3', 'grit') == 3 and props.faults == 1
+
+def churn(props, rand, adds):
+    '''
+    adds that keep coming back to a working set half again the hot cap
+    '''
+    for _ in range(adds):
+        props.add(f'user{rand.randrange(150)}', rand.choice(['grit', 'kindness']), 1, 1)
+
+def test_tiered_coalescing_benchmark(tmpdir):
+    '''
+    benchmark: with a working set that overflows the hot tier, coalescing
+    writes far fewer sqlite rows than one per eviction, and runs faster
+    than writing every eviction through
+    '''
+    results = {}
+    for flush_entries in (1, tiered.FLUSH_ENTRIES):
+        props = TieredTable(str(tmpdir.join(f'props.{flush_entries}.sqlite')), '', 200, flush_entries)
+        start = time.perf_counter()
+        churn(props, random.Random(0), 20000)
+        props.close()
+        results[flush_entries] = time.perf_counter() - start, props.evictions, props.writes
+    through, coalesced = results[1], results[tiered.FLUSH_ENTRIES]
+    report = f'(seconds, evictions, rows written): through {through}, coalesced {coalesced}'
+    assert coalesced[2] * 5 < through[2], report
+    assert coalesced[2] < coalesced[1] / 5, report
+    assert coalesced[0] < through[0], report
+
+def test_tiered_persistence(tmpdir):
+    '''
+    scopes share a file; close spills the hot tier so a restart sees it all
+    '''
+    props, channel = table(tmpdir, 10), table(tmpdir, 10, 'C1')
+    props.add('alice', 'grit', 3)
+    channel.add('alice', 'grit', 1)
+    props.close()
+    channel.close()
+    tiered.CONNECTIONS.clear()
+    assert table(tmpdir, 10).get('alice', 'grit') == 3
+    assert table(tmpdir, 10, 'C1').as_dict() == {'alice': {'grit': 1}}
+
+RESIDENT = '''
+import sys
+from tiered import TieredTable
+from table import PropsTable
+kind, cells, path = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+props = TieredTable(path, '', 1000) if kind == 'tiered' else PropsTable()
+for i in range(cells):
+    props.add(f'user{i}', 'grit', 1)
+with open('/proc/self/status') as f:
+    print(next(line.split()[1] for line in f if line.startswith('VmRSS:')))
+'''
+
+def resident(tmpdir, kind, cells):
+    '''
+    rss in kB of a fresh process after filling a table of kind with cells,
+    sqlite's page cache included
+    '''
+    result = subprocess.run(
+        [sys.executable, '-c', RESIDENT, kind, str(cells), str(tmpdir.join(f'{kind}.{cells}.sqlite'))],
+        cwd=BOTPATH,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True)
+    assert result.returncode == 0, result.stderr
+    return int(result.stdout)
+
+def test_tiered_benchmark(tmpdir):
+    '''
+    benchmark: process rss stays flat as the tiered table grows 20x, and
+    stays well under an in memory table of the same size
+    '''
+    if not os.path.exists('/proc/self/status'):
+        pytest.skip('needs /proc')
+    small = resident(tmpdir, 'tiered', 5000)
+    large = resident(tmpdir, 'tiered', 100000)
+    memory = resident(tmpdir, 'table', 100000)
+    report = f'rss kB: tiered {small} at 5k cells, {large} at 100k; in memory {memory} at 100k'
+    assert large < small * 1.5, report
+    assert large < memory, report
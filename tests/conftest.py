@@ -5,5 +5,5 @@ from pprint import pprint
 
 def pytest_configure(config):
     # added rootdir to sys.path so that imports would work in tests/*
-    path = '/'.join([str(config.rootdir), 'bot'])
+    path = '/'.join([str(config.rootdir), 'props', 'bot'])
     sys.path.insert(0, path)